@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+#
+
+'''
+    Timing, reporting and baseline comparison helpers shared by the resources/tools benchmarks
+'''
+
+import json
+import time
+import logging
+import platform
+import functools
+import multiprocessing
+import concurrent.futures
+from datetime import datetime
+
+
+def run_case(measure, *args):
+    '''
+    Call measure(*args) in a fresh process so peak RSS belongs to that case only: the process is spawned,
+    a forked one would start with the peak RSS of the benchmark process
+    '''
+    context = multiprocessing.get_context('spawn')
+    with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        return executor.submit(measure, *args).result()
+
+
+def timed(phases, phase, function):
+    '''Wrap function so its duration is added to phases[phase]'''
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        start = time.monotonic()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            phases[phase] = phases.get(phase, 0.0) + time.monotonic() - start
+    return wrapper
+
+
+def peak_rss_kb():
+    '''Peak resident set size of the current process'''
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def save_report(path, results, **versions):
+    '''Write results with the run date, Python and the given package versions'''
+    report = {
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+    }
+    report.update(versions)
+    report['results'] = results
+    with open(path, 'w') as contents:
+        json.dump(report, contents, indent=2)
+    logging.info(f'Results saved to {path}')
+
+
+def case_key(result, fields):
+    '''Identify a benchmark case across runs by its fields values'''
+    return tuple(result[field] for field in fields)
+
+
+def compare(baseline, results, threshold, fields, throughput, unit):
+    '''Report cases whose throughput(result) is below the baseline results by more than threshold percent'''
+    with open(baseline) as contents:
+        previous = {case_key(result, fields): result for result in json.load(contents)['results']}
+    regressions = 0
+    for result in results:
+        old = previous.get(case_key(result, fields))
+        if not old or not throughput(old) or not throughput(result):
+            continue
+        change = 100.0 * (throughput(result) / throughput(old) - 1)
+        if change < -threshold:
+            regressions += 1
+            logging.warning(f'Regression {case_key(result, fields)}: {change:+.1f}% {unit}')
+    return 1 if regressions else 0
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+#
+
+'''
+    End to end tests of the download_package_from_arm3 command line against a local stand-in ARM server
+'''
+
+import os
+import sys
+import json
+import shutil
+import hashlib
+import tempfile
+import threading
+import unittest
+import subprocess
+import socketserver
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+
+TOOL = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'download_package_from_arm3')
+REPO = '/artifactory/proj-ccsmnft-dev-local/com/ericsson/ccsm/test/ccsm-cli/'
+OLD_REPO = '/artifactory/proj-jcat-dev-local/com/ericsson/ccsm/test/ccsm-cli/'
+CREDENTIALS = ('user', 'secret')
+
+
+class ArmHandler(BaseHTTPRequestHandler):
+    '''Serve the files of the server, their checksums as ARM headers and the storage API'''
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self.reply(send_body=False)
+
+    def do_GET(self):
+        self.reply(send_body=True)
+
+    def reply(self, send_body):
+        self.server.requests.append((self.command, self.path))
+        files = self.server.files
+        if self.path.startswith('/artifactory/api/storage/'):
+            path = self.path.replace('/api/storage', '', 1)
+            if path in files:
+                body = {'checksums': {'sha256': hashlib.sha256(files[path]).hexdigest()}}
+            else:
+                names = {name[len(path):].split('/')[0] + ('/' if '/' in name[len(path):] else '')
+                         for name in files if name.startswith(path)}
+                if not names:
+                    return self.send_error(404)
+                body = {'children': [{'uri': '/' + name.rstrip('/'), 'folder': name.endswith('/')}
+                                     for name in sorted(names)]}
+            return self.send_body(json.dumps(body).encode(), {}, send_body)
+        if self.path not in files:
+            return self.send_error(404)
+        content = files[self.path]
+        digest = self.server.checksums.get(self.path) or hashlib.sha256(content).hexdigest()
+        self.send_body(content, {'X-Checksum-Sha256': digest}, send_body)
+
+    def send_body(self, body, headers, send_body):
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+
+class ArmServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), ArmHandler)
+        self.files = {}
+        self.checksums = {}
+        self.requests = []
+        self.url = 'http://127.0.0.1:{}'.format(self.server_address[1])
+
+
+class DownloadPackageFromArmTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ArmServer()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.work_dir = tempfile.mkdtemp()
+        self.output = os.path.join(self.work_dir, 'out')
+        os.mkdir(self.output)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def add_jar(self, path, content, repo=REPO):
+        self.server.files[repo + path] = content
+        return self.server.url + repo + path
+
+    def run_tool(self, *args):
+        command = [sys.executable, TOOL, '-u'] + list(CREDENTIALS) + ['-o', self.output,
+                                                                      '--cache-dir', os.path.join(self.work_dir, 'cache')]
+        process = subprocess.run(command + list(args), stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                 universal_newlines=True, timeout=120)
+        return process.returncode, process.stdout
+
+    def output_content(self, name):
+        with open(os.path.join(self.output, name), 'rb') as jar:
+            return jar.read()
+
+    def test_full_url_on_arm_server(self):
+        content = os.urandom(300000)
+        url = self.add_jar('2.53.3-SNAPSHOT/ccsm-cli-2.53.3-20210427.133924-3.jar', content)
+        code, output = self.run_tool('-v', url, '--arm-server', self.server.url)
+        self.assertEqual(code, 0, output)
+        self.assertEqual(self.output_content('ccsm-cli-2.53.3-20210427.133924-3.jar'), content)
+        self.assertNotIn('.part', ' '.join(os.listdir(self.output)))
+
+    def test_cached_download(self):
+        content = os.urandom(1000)
+        url = self.add_jar('2.53.3-SNAPSHOT/ccsm-cli-2.53.3-20210427.133924-3.jar', content)
+        self.assertEqual(self.run_tool('-v', url, '--arm-server', self.server.url)[0], 0)
+        os.remove(os.path.join(self.output, 'ccsm-cli-2.53.3-20210427.133924-3.jar'))
+        code, output = self.run_tool('-v', url, '--arm-server', self.server.url)
+        self.assertEqual(code, 0, output)
+        self.assertIn('Cache hit', output)
+        self.assertEqual(self.output_content('ccsm-cli-2.53.3-20210427.133924-3.jar'), content)
+        self.assertEqual(sum(1 for request in self.server.requests if request[0] == 'GET'), 1)
+
+    def test_cache_eviction_removes_lock_files(self):
+        first = self.add_jar('2.53.3-SNAPSHOT/ccsm-cli-2.53.3-20210427.133924-3.jar', os.urandom(700000))
+        second = self.add_jar('2.54.1-SNAPSHOT/ccsm-cli-2.54.1-20210601.101010-1.jar', os.urandom(700000))
+        for url in (first, second):
+            code, output = self.run_tool('-v', url, '--arm-server', self.server.url, '--cache-max-size', '1')
+            self.assertEqual(code, 0, output)
+        cache_dir = os.path.join(self.work_dir, 'cache')
+        cached = os.listdir(os.path.join(cache_dir, 'sha256'))
+        self.assertEqual(cached, [hashlib.sha256(self.server.files[second[len(self.server.url):]]).hexdigest()])
+        self.assertEqual(sorted(os.listdir(os.path.join(cache_dir, 'locks'))),
+                         ['evict-all.lock', 'sha256-{}.lock'.format(cached[0])])
+
+    def test_checksum_mismatch(self):
+        url = self.add_jar('2.53.3-SNAPSHOT/ccsm-cli-2.53.3-20210427.133924-3.jar', b'corrupted')
+        self.server.checksums[REPO + '2.53.3-SNAPSHOT/ccsm-cli-2.53.3-20210427.133924-3.jar'] = '0' * 64
+        code, output = self.run_tool('-v', url, '--arm-server', self.server.url, '--no-cache')
+        self.assertEqual(code, 3, output)
+        self.assertEqual(os.listdir(self.output), [])
+
+    def test_latest(self):
+        self.add_jar('2.53.3-SNAPSHOT/ccsm-cli-2.53.3-20210427.133924-3.jar', b'old')
+        self.add_jar('2.54.1-SNAPSHOT/ccsm-cli-2.54.1-20210601.101010-1.jar', b'previous')
+        self.add_jar('2.54.1-SNAPSHOT/ccsm-cli-2.54.1-20210602.101010-2.jar', b'latest')
+        self.add_jar('2.60.0-SNAPSHOT/ccsm-cli-2.60.0-20210701.101010-1.jar', b'other repo', OLD_REPO)
+        code, output = self.run_tool('-v', 'latest', '--arm-server', self.server.url)
+        self.assertEqual(code, 0, output)
+        self.assertEqual(os.listdir(self.output), ['ccsm-cli-2.54.1-20210602.101010-2.jar'])
+        self.assertEqual(self.output_content('ccsm-cli-2.54.1-20210602.101010-2.jar'), b'latest')
+
+    def test_drop_from_old_repo(self):
+        self.add_jar('2.53.3-SNAPSHOT/ccsm-cli-2.53.3-20210427.133924-3.jar', b'other drop')
+        self.add_jar('2.43.2-SNAPSHOT/ccsm-cli-2.43.2-20200427.133924-7.jar', b'drop43', OLD_REPO)
+        code, output = self.run_tool('-v', 'drop43', '--arm-server', self.server.url)
+        self.assertEqual(code, 0, output)
+        self.assertEqual(self.output_content('ccsm-cli-2.43.2-20200427.133924-7.jar'), b'drop43')
+        self.assertIn(('GET', REPO.replace('/artifactory/', '/artifactory/api/storage/', 1)), self.server.requests)
+
+    def test_http_url_needs_arm_server(self):
+        url = self.add_jar('2.53.3-SNAPSHOT/ccsm-cli-2.53.3-20210427.133924-3.jar', b'jar')
+        code, output = self.run_tool('-v', url)
+        self.assertNotEqual(code, 0, output)
+        self.assertIn('Invalid URL', output)
+        self.assertEqual(self.server.requests, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
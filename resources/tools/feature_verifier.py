@@ -6,52 +6,49 @@
 '''
 
 import os
+import io
+import re
 import sys
+import json
+import time
+import fcntl
+import socket
+import signal
 import atexit
 import shutil
 import logging
 import argparse
+import hashlib
 import tempfile
+import subprocess
+import threading
+import socketserver
+import functools
+import contextlib
+import collections
+import concurrent.futures
 
 from behave.__main__ import run_behave
 from behave.configuration import Configuration
+from behave.matchers import ParseMatcher
+from behave.model import ScenarioOutline
+from behave.parser import parse_feature, ParserError
 
 
 WORKSPACE = None
-
-
-@atexit.register
-def clean_workspace(*args):
-    '''Remove workspace'''
-    if WORKSPACE is not None:
-        try:
-            shutil.rmtree(WORKSPACE, ignore_errors=True)
-        except Exception as error:
-            logging.error(f'Cannot remove temporal workspace "{WORKSPACE}": {error}')
-
-
-def main():
-    '''Main program'''
-    global WORKSPACE
-    user_options = parse_commandline()
-    if not user_options:
-        return -1
-
-    WORKSPACE = tempfile.mkdtemp()
-
-    logging.info('Populating workspace...')
-    for feature in user_options.feature:
-        logging.debug(f'Adding {feature}')        
-        shutil.copy(feature, WORKSPACE)
-
-    logging.info('Adding steps file...')
-    steps_dir = os.path.join(WORKSPACE, 'steps')
-    os.makedirs(steps_dir, exist_ok=True)
-    with open(os.path.join(steps_dir, '__init__.py'), 'w') as contents:
-        contents.write('''# Test steps verifier
-''')
-    with open(os.path.join(steps_dir, 'steps.py'), 'w') as contents:
-        contents.write('''# Test steps verifier
+STEP_INDEXES = {}
+STEP_INDEXES_LOCK = threading.Lock()
+DEFAULT_CACHE_DIR = os.environ.get('FEATURE_VERIFIER_CACHE', os.path.expanduser('~/.cache/feature_verifier'))
+DEFAULT_CACHE_SIZE = 64  # MiB
+# Only reachable by its user: the directory is private and the socket mode 0600
+DEFAULT_SOCKET = os.path.join(os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir(),
+                              f'feature_verifier-{os.getuid()}', 'verifier.sock')
+DAEMON_START_TIMEOUT = 60  # seconds
+DEFAULT_IDLE_TIMEOUT = 600  # seconds
+STEP_DEFINITION_RE = re.compile(r"^@(given|when|then)\(u'(.*)'\)", re.MULTILINE)
+STEP_FUNCTION_RE = re.compile(r"\s*def (\w+)\(")
+
+STEPS_DEFINITION = '''# Test steps verifier
 import logging
 DEB = logging.debug
 
@@ -635,31 +632,699 @@ def send_dia2(context):
     DEB(f'** send_dia2({context})')
 
 
-''')
+'''
+
+
+@atexit.register
+def clean_workspace(*args):
+    '''Remove workspace'''
+    if WORKSPACE is not None:
+        try:
+            shutil.rmtree(WORKSPACE, ignore_errors=True)
+        except Exception as error:
+            logging.error(f'Cannot remove temporal workspace "{WORKSPACE}": {error}')
+
+
+def main():
+    '''Main program'''
+    global WORKSPACE
+    user_options = parse_commandline()
+    if not user_options:
+        return -1
 
-    logging.info(f'Compiling feature: {feature}')
+    if user_options.serve:
+        return serve(user_options.socket, user_options.jobs, user_options.idle_timeout)
 
-    #behave_config = Configuration([WORKSPACE, '-f', 'null', '--no-capture'])
-    behave_config = Configuration([WORKSPACE])
-    errors = run_behave(behave_config)
+    if user_options.profile:
+        # Statistics are gathered in this process, from every feature
+        user_options.fast = True
+        user_options.connect = False
+        user_options.no_cache = True
+        user_options.jobs = 1
+
+    if user_options.connect and user_options.start_daemon and daemon_version(user_options.socket) != script_digest():
+        try:
+            start_daemon(user_options.socket, user_options.jobs, user_options.idle_timeout)
+        except OSError as error:
+            logging.warning(f'Cannot start verifier daemon: {error}')
+    if user_options.connect and daemon_version(user_options.socket) != script_digest():
+        logging.warning(f'Verifier daemon of this version not available at "{user_options.socket}", verifying locally')
+        user_options.connect = False
+
+    if user_options.connect:
+        verifier = functools.partial(request_verification, user_options.socket)
+        jobs = user_options.jobs or 1
+    elif user_options.fast:
+        logging.info('Building step index...')
+        index = get_step_index()
+        if user_options.profile:
+            index.enable_profiling()
+        verifier = check_feature
+        jobs = user_options.jobs or 1
+    else:
+        WORKSPACE = tempfile.mkdtemp()
+        prepare_workspace(WORKSPACE)
+        verifier = functools.partial(verify_feature, WORKSPACE)
+        jobs = user_options.jobs
+
+    cache = None
+    if not user_options.no_cache:
+        cache = ResultCache(user_options.cache_dir, user_options.cache_size * 1024 * 1024,
+                            'fast' if user_options.fast or user_options.connect else 'behave')
+
+    results = {}
+    pending = []
+    for feature in user_options.feature:
+        cached = cache.get(feature) if cache else None
+        if cached:
+            results[feature] = cached
+        else:
+            pending.append(feature)
+
+    for result in verify_features(pending, verifier, jobs):
+        results[result[0]] = result
+        if cache:
+            cache.put(result)
+
+    results = [results[feature] for feature in user_options.feature]
+    errors = 0
+    for feature, feature_errors, output, _ in results:
+        logging.info(f'Compiling feature: {feature}')
+        print(output, end='')
+        errors += 1 if feature_errors else 0
+
+    show_verdicts(results)
+    if user_options.profile:
+        save_profile(user_options.profile, get_step_index(), results)
+    if cache:
+        cache.trim()
+        print(cache.summary())
     print(f'Errors: {errors}')
 
-    return errors
+    return 1 if errors else 0
+
+
+class StepIndex:
+    '''
+    Step patterns bucketed by step type and first word of their literal prefix, so a
+    step text is only tried against the patterns that can possibly match it
+    '''
+
+    def __init__(self, source):
+        self.case_sensitive = getattr(ParseMatcher, 'CASE_SENSITIVE', False)
+        self.literals = {}
+        self.buckets = {}
+        self.definitions = []
+        self.stats = None
+        for match in STEP_DEFINITION_RE.finditer(source):
+            step_type, pattern = match.groups()
+            line = source.count('\n', 0, match.start()) + 1
+            function = STEP_FUNCTION_RE.match(source, match.end())
+            self.add(step_type, pattern, line, function.group(1) if function else None)
+
+    @property
+    def size(self):
+        return len(self.definitions)
+
+    def normalize(self, text):
+        '''Fold text as the behave step matcher compares it'''
+        return text if self.case_sensitive else text.lower()
+
+    def add(self, step_type, pattern, line, function=None):
+        '''Add a step pattern to its bucket'''
+        position = self.size
+        self.definitions.append((step_type, pattern, line, function))
+        if '{' not in pattern:
+            literals = self.literals.setdefault(step_type, {})
+            literals.setdefault(self.normalize(pattern), []).append((position, pattern, line))
+            return
+        prefix = self.normalize(pattern[:pattern.index('{')])
+        word, separator, _ = prefix.partition(' ')
+        # Patterns without a complete first word can match any step
+        key = word if separator else ''
+        bucket = self.buckets.setdefault(step_type, {}).setdefault(key, [])
+        bucket.append((position, prefix, ParseMatcher(None, pattern), pattern, line))
+
+    def match(self, step_type, text):
+        '''Return (pattern, line) of every definition matching text, in definition order'''
+        key = self.normalize(text)
+        found = list(self.literals.get(step_type, {}).get(key, []))
+        buckets = self.buckets.get(step_type, {})
+        for bucket in (buckets.get(key.partition(' ')[0], []), buckets.get('', [])):
+            for position, prefix, matcher, pattern, line in bucket:
+                if not key.startswith(prefix):
+                    continue
+                if self.stats is None:
+                    matched = matcher.check_match(text) is not None
+                else:
+                    matched = self.profiled_match(position, matcher, text)
+                if matched:
+                    found.append((position, pattern, line))
+        found.sort()
+        if self.stats is not None:
+            self.profile_step(step_type, [position for position, _, _ in found])
+        return [(pattern, line) for _, pattern, line in found]
+
+    def enable_profiling(self):
+        '''Start recording match statistics of every definition'''
+        self.stats = [{'matches': 0, 'shadowed': 0, 'attempts': 0, 'failed_attempts': 0,
+                       'match_time': 0.0, 'behave_failed_attempts': 0} for _ in self.definitions]
+
+    def profiled_match(self, position, matcher, text):
+        '''Try a matcher recording its cost'''
+        stats = self.stats[position]
+        start = time.perf_counter()
+        matched = matcher.check_match(text) is not None
+        stats['match_time'] += time.perf_counter() - start
+        stats['attempts'] += 1
+        if not matched:
+            stats['failed_attempts'] += 1
+        return matched
+
+    def profile_step(self, step_type, positions):
+        '''Account a step: behave uses its first matching definition after trying every earlier one'''
+        for position in positions[1:]:
+            self.stats[position]['shadowed'] += 1
+        winner = positions[0] if positions else self.size
+        if positions:
+            self.stats[winner]['matches'] += 1
+        for position, definition in enumerate(self.definitions[:winner]):
+            if definition[0] == step_type:
+                self.stats[position]['behave_failed_attempts'] += 1
+
+    def profile_report(self):
+        '''Match statistics of every definition plus the unused ones'''
+        functions = collections.Counter(function for _, _, _, function in self.definitions)
+        definitions = []
+        for (step_type, pattern, line, function), stats in zip(self.definitions, self.stats):
+            definition = {'step_type': step_type, 'pattern': pattern, 'line': line, 'function': function,
+                          'duplicated_function': functions[function] > 1}
+            definition.update(stats)
+            definitions.append(definition)
+        return {
+            'definitions': definitions,
+            'unused': [definition['pattern'] for definition in definitions if not definition['matches']],
+            'costliest': [definition['pattern'] for definition in
+                          sorted(definitions, key=lambda item: item['behave_failed_attempts'], reverse=True)[:10]],
+        }
+
+
+class ResultCache:
+    '''
+    On-disk verification results keyed by the feature contents, the step definitions and this script,
+    least recently used entries are evicted when the cache grows over max_size bytes
+    '''
+
+    def __init__(self, directory, max_size, engine):
+        self.directory = directory
+        self.max_size = max_size
+        self.version_digest = hashlib.sha256(f'{script_digest()}\n{engine}\n{STEPS_DEFINITION}'.encode()).hexdigest()
+        self.hits = 0
+        self.misses = 0
+        self.saved = 0.0
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, feature):
+        '''Cache entry file of a feature'''
+        digest = hashlib.sha256(self.version_digest.encode())
+        with open(feature, 'rb') as contents:
+            digest.update(contents.read())
+        return os.path.join(self.directory, f'{digest.hexdigest()}.json')
+
+    def get(self, feature):
+        '''Return the stored result of a feature, None if not cached'''
+        path = self.path(feature)
+        try:
+            with open(path) as contents:
+                entry = json.load(contents)
+            os.utime(path)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.saved += entry['duration']
+        logging.debug(f'Cached result for {feature}: {path}')
+        return feature, entry['errors'], entry['output'].replace(entry['feature'], feature), entry['duration']
+
+    def put(self, result):
+        '''Store the result of a feature'''
+        feature, errors, output, duration = result
+        path = self.path(feature)
+        try:
+            # Write and rename so concurrent jobs never read a partial entry
+            with tempfile.NamedTemporaryFile('w', dir=self.directory, suffix='.tmp', delete=False) as contents:
+                json.dump({'feature': feature, 'errors': errors, 'output': output, 'duration': duration}, contents)
+            os.replace(contents.name, path)
+        except OSError as error:
+            logging.warning(f'Cannot store cached result for {feature}: {error}')
+
+    def trim(self):
+        '''Evict least recently used entries until the cache fits max_size'''
+        entries = []
+        for entry in os.scandir(self.directory):
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def summary(self):
+        '''Cache usage report'''
+        return f'Cache: {self.hits} hit(s), {self.misses} miss(es), {self.saved:.3f}s of verification saved'
+
+
+@functools.lru_cache(maxsize=None)
+def script_digest():
+    '''Digest of this script: results and daemons of another version of it must not be used'''
+    with open(os.path.abspath(__file__), 'rb') as contents:
+        return hashlib.sha256(contents.read()).hexdigest()
+
+
+def steps_digest(source):
+    '''Digest identifying a step definitions source'''
+    return hashlib.sha256(source.encode()).hexdigest()
+
+
+def get_step_index(source=STEPS_DEFINITION):
+    '''Build the step index of a step definitions source once per process'''
+    digest = steps_digest(source)
+    with STEP_INDEXES_LOCK:
+        if digest not in STEP_INDEXES:
+            # Keep a few indexes only: clients sending new definitions replace old ones
+            while len(STEP_INDEXES) >= 4:
+                del STEP_INDEXES[next(iter(STEP_INDEXES))]
+            STEP_INDEXES[digest] = StepIndex(source)
+        return STEP_INDEXES[digest]
+
+
+def find_step_index(digest):
+    '''Step index already built for a step definitions digest, None if unknown'''
+    with STEP_INDEXES_LOCK:
+        return STEP_INDEXES.get(digest)
+
+
+def prepare_workspace(workspace, steps=STEPS_DEFINITION):
+    '''Add steps file to the workspace'''
+    logging.info('Adding steps file...')
+    steps_dir = os.path.join(workspace, 'steps')
+    os.makedirs(steps_dir, exist_ok=True)
+    with open(os.path.join(steps_dir, '__init__.py'), 'w') as contents:
+        contents.write('''# Test steps verifier
+''')
+    with open(os.path.join(steps_dir, 'steps.py'), 'w') as contents:
+        contents.write(steps)
+
+
+def verify_feature(workspace, position, feature):
+    '''Run behave over a single feature, return (feature, errors, output)'''
+    # Each feature gets its own directory so behave only loads that file, the
+    # steps directory is found walking up from it
+    feature_dir = os.path.join(workspace, 'features', str(position))
+    os.makedirs(feature_dir, exist_ok=True)
+    logging.debug(f'Adding {feature}')
+    feature_copy = shutil.copy(feature, feature_dir)
+
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        behave_config = Configuration([feature_copy])
+        errors = run_behave(behave_config)
+    return feature, errors, strip_workspace(output.getvalue(), workspace, feature_copy, feature)
+
+
+def strip_workspace(output, workspace, feature_copy, feature):
+    '''
+    Refer to the feature by its own path and to the steps file by its name in behave output, instead of
+    temporary workspace paths (absolute or relative to the current directory) changing on every run
+    '''
+    workspace_name = re.escape(os.path.basename(workspace))
+    copy_path = re.escape(os.path.relpath(feature_copy, workspace))
+    output = re.sub(rf'[^\s#"\']*{workspace_name}/{copy_path}', lambda match: feature, output)
+    return re.sub(rf'[^\s#"\']*{workspace_name}/steps/', '', output)
+
+
+def check_feature(position, feature):
+    '''Parse a feature and match its steps against the step index, return (feature, errors, output)'''
+    with open(feature) as contents:
+        result = check_feature_text(feature, contents.read(), get_step_index())
+    return feature, result['errors'], format_check(result)
+
+
+def check_feature_text(feature, text, index):
+    '''Match the steps of a feature text against a step index, return a structured result'''
+    result = {'feature': feature, 'errors': 0, 'steps': 0, 'undefined': [], 'ambiguous': [], 'parse_error': None}
+    try:
+        model = parse_feature(text, filename=feature)
+    except ParserError as error:
+        result['errors'] = 1
+        result['parse_error'] = {'line': getattr(error, 'line', None), 'message': str(error)}
+        return result
+
+    for step, name, row in iter_feature_steps(model):
+        result['steps'] += 1
+        matches = index.match(step.step_type, name)
+        if not matches:
+            result['undefined'].append({'line': step.line, 'row': row, 'step': f'{step.keyword} {name}'})
+        elif len(matches) > 1:
+            result['ambiguous'].append({'line': step.line, 'row': row, 'step': f'{step.keyword} {name}',
+                                        'definitions': [line for _, line in matches]})
+    result['errors'] = 1 if result['undefined'] else 0
+    return result
+
+
+def format_check(result):
+    '''Render a structured check result as compiler-like text'''
+    feature = result['feature']
+    if result['parse_error']:
+        return f'{feature}: parse error: {result["parse_error"]["message"]}\n'
+    output = io.StringIO()
+    for step in result['undefined']:
+        output.write(f'{feature}:{step["line"]}: undefined step: {step["step"]}{format_row(step)}\n')
+    for step in result['ambiguous']:
+        lines = ', '.join(f'steps.py:{line}' for line in step['definitions'])
+        output.write(f'{feature}:{step["line"]}: ambiguous step: {step["step"]} ({lines}){format_row(step)}\n')
+    output.write(f'{feature}: {result["steps"]} steps, {len(result["undefined"])} undefined, '
+                 f'{len(result["ambiguous"])} ambiguous\n')
+    return output.getvalue()
+
+
+def format_row(step):
+    '''Example row reference of a scenario outline step'''
+    return f' [example row at line {step["row"]}]' if step.get('row') else ''
+
+
+def iter_feature_steps(feature):
+    '''Walk every step of a parsed feature as (step, step text, example row line)'''
+    if feature is None:
+        return
+    for container in [feature] + list(getattr(feature, 'rules', [])):
+        if container.background:
+            for step in container.background.steps:
+                yield step, step.name, None
+        for scenario in container.scenarios:
+            if isinstance(scenario, ScenarioOutline):
+                yield from iter_outline_steps(scenario)
+            else:
+                for step in scenario.steps:
+                    yield step, step.name, None
+
+
+def iter_outline_steps(outline):
+    '''
+    Walk the steps of a scenario outline without building its scenarios: template steps
+    without placeholders are checked once, the others are substituted one example row at a time
+    '''
+    for step in outline.steps:
+        if '<' not in step.name:
+            yield step, step.name, None
+    for example in outline.examples:
+        if example.table is None:
+            continue
+        templates = []
+        for step in outline.steps:
+            if '<' in step.name:
+                placeholders = [(column, f'<{heading}>') for column, heading in enumerate(example.table.headings)
+                                if f'<{heading}>' in step.name]
+                templates.append((step, placeholders))
+        for row in example.table.rows:
+            for step, placeholders in templates:
+                name = step.name
+                for column, placeholder in placeholders:
+                    name = name.replace(placeholder, row.cells[column])
+                yield step, name, row.line
+
+
+def verify_features(features, verifier, jobs=None):
+    '''Verify features, sharding them across a process pool when needed'''
+    if not features:
+        return []
+    jobs = min(jobs or os.cpu_count() or 1, len(features))
+    logging.info(f'Verifying {len(features)} feature(s) using {jobs} process(es)...')
+    timed_verifier = functools.partial(timed, verifier)
+    if jobs <= 1:
+        return [timed_verifier(position, feature) for position, feature in enumerate(features)]
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(timed_verifier, range(len(features)), features))
+
+
+def timed(verifier, position, feature):
+    '''Run a verifier, return its result plus the time spent'''
+    start = time.monotonic()
+    result = verifier(position, feature)
+    return result + (time.monotonic() - start,)
+
+
+class VerifierServer(socketserver.UnixStreamServer):
+    '''
+    Unix socket server handing connections over to a pool of worker threads,
+    stopped once no request arrived for idle_timeout seconds (never when None)
+    '''
+
+    def __init__(self, path, workers, idle_timeout=None):
+        super().__init__(path, VerifierRequestHandler)
+        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+        self.idle_timeout = idle_timeout
+        self.activity = threading.Lock()
+        self.active = 0
+        self.last_activity = time.monotonic()
+
+    def process_request(self, request, client_address):
+        with self.activity:
+            self.active += 1
+        self.pool.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            with self.activity:
+                self.active -= 1
+                self.last_activity = time.monotonic()
+
+    def stop_when_idle(self):
+        '''Shut the server down once idle for idle_timeout seconds, run in its own thread'''
+        while True:
+            time.sleep(1)
+            with self.activity:
+                idle = not self.active and time.monotonic() - self.last_activity >= self.idle_timeout
+            if idle:
+                logging.info(f'No request for {self.idle_timeout}s, stopping')
+                self.shutdown()
+                return
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=False)
+
+
+class VerifierRequestHandler(socketserver.StreamRequestHandler):
+    '''
+    Answer newline-delimited JSON requests. A verification request holds "feature" (name only), "text"
+    (feature contents) and "steps_digest" (digest of the step definitions source), plus "steps" (the source)
+    when the daemon answered that it does not know that digest. {"command": "version"} returns the digest of
+    the daemon script, {"command": "stop"} stops the daemon
+    '''
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                command = request.get('command')
+                if command == 'version':
+                    response = {'version': script_digest()}
+                elif command == 'stop':
+                    threading.Thread(target=self.server.shutdown, daemon=True).start()
+                    response = {'stopping': True}
+                else:
+                    response = self.verify(request)
+            except Exception as error:
+                response = {'error': f'{type(error).__name__}: {error}'}
+            self.wfile.write(json.dumps(response).encode() + b'\n')
+            self.wfile.flush()
+
+    def verify(self, request):
+        '''Check an inline feature text, no file is ever read on behalf of a client'''
+        if 'steps' in request:
+            index = get_step_index(request['steps'])
+        else:
+            index = find_step_index(request['steps_digest'])
+            if index is None:
+                return {'unknown_steps': True}
+        return check_feature_text(request['feature'], request['text'], index)
+
+
+def private_socket_dir(path):
+    '''Create the directory of a daemon socket, check it is private to the current user'''
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    stat = os.stat(directory)
+    if stat.st_uid != os.getuid() or stat.st_mode & 0o077:
+        raise PermissionError(f'Verifier daemon socket directory "{directory}" must only be accessible by its owner')
+
+
+def serve(path, workers=None, idle_timeout=DEFAULT_IDLE_TIMEOUT):
+    '''Run the verifier daemon until interrupted, stopped or idle for idle_timeout seconds'''
+    private_socket_dir(path)
+    if os.path.exists(path):
+        os.remove(path)
+    logging.info('Building step index...')
+    get_step_index()
+    umask = os.umask(0o177)
+    try:
+        server = VerifierServer(path, workers or os.cpu_count() or 1, idle_timeout)
+    finally:
+        os.umask(umask)
+    socket_inode = os.stat(path).st_ino
+    logging.info(f'Verifier daemon listening on {path}')
+    if idle_timeout:
+        threading.Thread(target=server.stop_when_idle, daemon=True).start()
+    # Stopping the daemon (e.g. killed with its Jenkins executor) must also remove its socket
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        with contextlib.suppress(OSError):
+            # Unless a new daemon already replaced it
+            if os.stat(path).st_ino == socket_inode:
+                os.remove(path)
+    return 0
+
+
+def start_daemon(path, workers=None, idle_timeout=DEFAULT_IDLE_TIMEOUT):
+    '''
+    Start a detached verifier daemon on path, unless another client already did, and wait until it is ready.
+    A daemon of another version of this script is stopped first
+    '''
+    private_socket_dir(path)
+    with open(f'{path}.lock', 'a') as lock:
+        # Only one client per node starts the daemon, the others wait for it
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        version = daemon_version(path)
+        if version == script_digest():
+            return
+        if version is not None:
+            logging.info(f'Stopping verifier daemon of another version on "{path}"')
+            stop_daemon(path)
+        command = [sys.executable, os.path.abspath(__file__), '--serve', '--socket', path,
+                   '--idle-timeout', str(idle_timeout or 0)]
+        if workers:
+            command += ['--jobs', str(workers)]
+        # Jenkins kills the processes started by a build when it finishes, unless told otherwise:
+        # the daemon outlives the build, and stops by itself once idle
+        env = dict(os.environ, BUILD_ID='dontKillMe', JENKINS_NODE_COOKIE='dontKillMe')
+        with open(f'{path}.log', 'a') as log:
+            daemon = subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT,
+                                      env=env, start_new_session=True)
+        logging.info(f'Verifier daemon started (pid {daemon.pid}), log in "{path}.log"')
+        deadline = time.monotonic() + DAEMON_START_TIMEOUT
+        while daemon.poll() is None and time.monotonic() < deadline:
+            if daemon_version(path) == script_digest():
+                return
+            time.sleep(0.2)
+        logging.warning(f'Verifier daemon did not start listening on "{path}" within {DAEMON_START_TIMEOUT}s')
+
+
+def stop_daemon(path):
+    '''Ask the verifier daemon on path to stop, and wait until it does'''
+    with contextlib.suppress(OSError, ValueError):
+        send_request(path, {'command': 'stop'})
+    deadline = time.monotonic() + DAEMON_START_TIMEOUT
+    while daemon_version(path) is not None and time.monotonic() < deadline:
+        time.sleep(0.2)
+
+
+def send_request(path, request):
+    '''Send a request to the verifier daemon on path, return its response'''
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(path)
+        client.sendall(json.dumps(request).encode() + b'\n')
+        with client.makefile('rb') as response:
+            return json.loads(response.readline())
+
+
+def daemon_version(path):
+    '''Script digest of the verifier daemon on path, None if no daemon of the current user answers'''
+    try:
+        if os.stat(path).st_uid != os.getuid():
+            logging.warning(f'Ignoring verifier daemon socket "{path}" of another user')
+            return None
+        return send_request(path, {'command': 'version'}).get('version', '')
+    except (OSError, ValueError):
+        return None
+
+
+def request_verification(path, position, feature, steps=STEPS_DEFINITION):
+    '''Verify a feature through the verifier daemon, return (feature, errors, output)'''
+    with open(feature) as contents:
+        request = {'feature': feature, 'text': contents.read(), 'steps_digest': steps_digest(steps)}
+    result = send_request(path, request)
+    if result.get('unknown_steps'):
+        # Step definitions are only sent when the daemon does not have them yet
+        request['steps'] = steps
+        result = send_request(path, request)
+    if 'error' in result:
+        return feature, 1, f'{feature}: verifier daemon error: {result["error"]}\n'
+    return feature, result['errors'], format_check(result)
+
+
+def save_profile(path, index, results):
+    '''Write step index match statistics as JSON'''
+    report = index.profile_report()
+    report['features'] = [feature for feature, *_ in results]
+    with open(path, 'w') as contents:
+        json.dump(report, contents, indent=2)
+    logging.info(f'Step match profile saved to {path}: {len(report["unused"])} unused definitions')
+
+
+def show_verdicts(results):
+    '''Show per-feature verification result'''
+    print('Verification summary:')
+    for feature, errors, *_ in results:
+        print(f'  {"FAILED" if errors else "OK    "} {feature}')
 
 
 def parse_commandline():
     '''Parse and check command line'''
     parser = argparse.ArgumentParser(prog=os.path.basename(__file__), description=__doc__)
 
-    parser.add_argument('feature', nargs='+', help='Feature files to check')
+    parser.add_argument('feature', nargs='*', help='Feature files to check')
 
     parser.add_argument('-f', '--force', action='store_true', default=False, help='Ignore compilation errors and continue', dest='ignore_errors')
+    parser.add_argument('--fast', action='store_true', default=False, help='Only parse features and match steps against the step index, without running behave', dest='fast')
+    parser.add_argument('--profile', default=None, help='Save step match statistics as JSON to this file (implies --fast)', dest='profile')
+    parser.add_argument('--serve', action='store_true', default=False, help='Run as a verifier daemon listening on --socket', dest='serve')
+    parser.add_argument('--connect', action='store_true', default=False, help='Verify features through the daemon listening on --socket', dest='connect')
+    parser.add_argument('--start-daemon', action='store_true', default=False, help='With --connect, start the daemon when it is not running, or restart it when it runs another version of this script', dest='start_daemon')
+    parser.add_argument('--socket', default=DEFAULT_SOCKET, help=f'Verifier daemon socket, in a directory only accessible by its owner (default: {DEFAULT_SOCKET})', dest='socket')
+    parser.add_argument('--idle-timeout', type=int, default=DEFAULT_IDLE_TIMEOUT, help=f'Seconds without requests before the daemon stops, 0 to never stop (default: {DEFAULT_IDLE_TIMEOUT})', dest='idle_timeout')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='Number of parallel processes, or daemon worker threads (default: number of CPUs)', dest='jobs')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help=f'Directory of cached results (default: {DEFAULT_CACHE_DIR})', dest='cache_dir')
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_SIZE, help=f'Maximum cache size in MiB (default: {DEFAULT_CACHE_SIZE})', dest='cache_size')
+    parser.add_argument('--no-cache', action='store_true', default=False, help='Do not use cached results', dest='no_cache')
     parser.add_argument('-d', '--debug', action='store_true', default=False, help='Show debug logging', dest='debug')
 
     args = parser.parse_args()
 
     logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO)
 
+    if not args.serve and not args.feature:
+        logging.error('No feature files to check!')
+        return None
     for feature_file in args.feature:
         if not os.path.exists(feature_file):
             logging.error(f'Feature file "{feature_file}" not exists!')
@@ -670,4 +1335,3 @@ def parse_commandline():
 
 if __name__ == '__main__':
     sys.exit(main())
-
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+#
+
+'''
+    Benchmark feature_verifier.py engines over a synthetic NFT feature corpus
+'''
+
+import os
+import re
+import sys
+import time
+import random
+import shutil
+import logging
+import argparse
+import tempfile
+import threading
+import itertools
+import contextlib
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import feature_verifier  # noqa: E402
+from benchmark_common import run_case, peak_rss_kb, save_report, compare  # noqa: E402
+
+
+ENGINES = ('behave', 'fast', 'daemon')
+CASE_FIELDS = ('engine', 'features', 'steps_per_scenario', 'rows', 'registry')
+KEYWORDS = {'given': 'Given', 'when': 'When', 'then': 'Then'}
+SAMPLE_VALUES = {
+    'imsi': '262280000000001',
+    'mscid': '1',
+    'interval': '500',
+    'amount': '5',
+    'status': '200',
+    'server_id': '1',
+    'server_type': 'UDM',
+    'target': 'UDM',
+    'operation': 'POST',
+    'keyIndex': '1',
+}
+
+
+def main():
+    '''Main program'''
+    user_options = parse_commandline()
+
+    results = []
+    for features, steps, rows, extra in itertools.product(user_options.features, user_options.steps,
+                                                          user_options.rows, user_options.extra_steps):
+        for engine in user_options.engines:
+            result = run_case(measure, engine, features, steps, rows, extra, user_options.seed)
+            logging.info(f'{engine:6} features={features} steps={steps} rows={rows} registry={result["registry"]}: '
+                         f'{result["seconds"]:.3f}s, {result["steps_per_second"]:.0f} steps/s, '
+                         f'peak RSS {result["peak_rss_kb"]} KiB')
+            results.append(result)
+
+    save_report(user_options.output, results, behave=behave_version())
+
+    if user_options.baseline:
+        return compare(user_options.baseline, results, user_options.threshold, CASE_FIELDS,
+                       lambda result: result['steps_per_second'], 'steps/s')
+    return 0
+
+
+def behave_version():
+    '''Installed behave version'''
+    import behave
+    return getattr(behave, '__version__', 'unknown')
+
+
+def step_definitions(extra):
+    '''Embedded step definitions plus extra synthetic ones to grow the registry'''
+    source = feature_verifier.STEPS_DEFINITION
+    for number in range(extra):
+        source += f'''
+@given(u'synthetic step {number} sets {{value}}')
+def synthetic_step_{number}(context, value):
+    DEB(f'** synthetic_step_{number}({{context}}, {{value}})')
+'''
+    return source
+
+
+def registry_patterns(source):
+    '''(step type, pattern) of every step definition in source'''
+    return [match.groups() for match in feature_verifier.STEP_DEFINITION_RE.finditer(source)]
+
+
+def fill(pattern, value=None):
+    '''Step text of a pattern, placeholders replaced by sample values (or value(name))'''
+    return re.sub(r'\{(\w+)\}', lambda match: value(match.group(1)) if value
+                                   else SAMPLE_VALUES.get(match.group(1), 'value'), pattern)
+
+
+def scenario_steps(patterns, count, rng, value=None):
+    '''Lines of count Given/When/Then steps picked from patterns'''
+    lines = []
+    previous = None
+    for step_type in ('given', 'when', 'then'):
+        candidates = [pattern for kind, pattern in patterns if kind == step_type]
+        for _ in range(max(1, count // 3)):
+            keyword = 'And' if previous == step_type else KEYWORDS[step_type]
+            lines.append(f'    {keyword} {fill(rng.choice(candidates), value)}')
+            previous = step_type
+    return lines
+
+
+def generate_corpus(directory, patterns, features, steps, rows, seed):
+    '''Write features to directory, return (paths, number of steps)'''
+    rng = random.Random(seed)
+    parametric = [(kind, pattern) for kind, pattern in patterns if '{' in pattern]
+    paths = []
+    total = 0
+    for number in range(features):
+        lines = [f'Feature: Synthetic NFT feature {number}', '',
+                 '  Background:', '    Given target type is UDM', '']
+        for scenario in range(3):
+            lines.append(f'  Scenario: Synthetic scenario {scenario}')
+            scenario_lines = scenario_steps(patterns, steps, rng)
+            lines.extend(scenario_lines + [''])
+            total += len(scenario_lines) + 1
+        if rows:
+            lines.append('  Scenario Outline: Synthetic outline')
+            outline_lines = scenario_steps(parametric, steps, rng, lambda name: f'<{name}>')
+            columns = sorted(set(re.findall(r'<(\w+)>', '\n'.join(outline_lines))))
+            lines.extend(outline_lines)
+            lines.extend(['    Examples:', '      | ' + ' | '.join(columns) + ' |'])
+            for row in range(rows):
+                lines.append('      | ' + ' | '.join(f'{SAMPLE_VALUES.get(column, "value")}{row}' for column in columns) + ' |')
+            total += (len(outline_lines) + 1) * rows
+        path = os.path.join(directory, f'synthetic_{number}.feature')
+        with open(path, 'w') as contents:
+            contents.write('\n'.join(lines) + '\n')
+        paths.append(path)
+    return paths, total
+
+
+def measure(engine, features, steps, rows, extra, seed):
+    '''Generate a corpus and time its verification with engine'''
+    source = step_definitions(extra)
+    directory = tempfile.mkdtemp()
+    try:
+        paths, total = generate_corpus(directory, registry_patterns(source), features, steps, rows, seed)
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            start = time.monotonic()
+            errors = ENGINE_RUNNERS[engine](directory, paths, source)
+            seconds = time.monotonic() - start
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return {
+        'engine': engine,
+        'features': features,
+        'steps_per_scenario': steps,
+        'rows': rows,
+        'registry': len(registry_patterns(source)),
+        'steps': total,
+        'errors': errors,
+        'seconds': seconds,
+        'steps_per_second': total / seconds if seconds else 0.0,
+        'peak_rss_kb': peak_rss_kb(),
+    }
+
+
+def run_behave_engine(directory, paths, source):
+    '''Full behave run per feature'''
+    workspace = os.path.join(directory, 'workspace')
+    feature_verifier.prepare_workspace(workspace, source)
+    return sum(1 for _, errors, _ in (feature_verifier.verify_feature(workspace, position, path)
+                                       for position, path in enumerate(paths)) if errors)
+
+
+def run_fast_engine(directory, paths, source):
+    '''Parse and match against the step index, index build included'''
+    index = feature_verifier.StepIndex(source)
+    errors = 0
+    for path in paths:
+        with open(path) as contents:
+            errors += feature_verifier.check_feature_text(path, contents.read(), index)['errors']
+    return errors
+
+
+def run_daemon_engine(directory, paths, source):
+    '''Requests to an in-process verifier daemon, daemon startup excluded'''
+    path = os.path.join(directory, 'verifier.sock')
+    server = feature_verifier.VerifierServer(path, 1)
+    feature_verifier.get_step_index(source)
+    thread = threading.Thread(target=server.serve_forever, args=(0.01,), daemon=True)
+    thread.start()
+    try:
+        return sum(1 for _, errors, _ in (feature_verifier.request_verification(path, position, feature, source)
+                                           for position, feature in enumerate(paths)) if errors)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+ENGINE_RUNNERS = {
+    'behave': run_behave_engine,
+    'fast': run_fast_engine,
+    'daemon': run_daemon_engine,
+}
+
+
+def parse_commandline():
+    '''Parse and check command line'''
+    parser = argparse.ArgumentParser(prog=os.path.basename(__file__), description=__doc__)
+
+    parser.add_argument('-e', '--engines', nargs='+', choices=ENGINES, default=list(ENGINES), help='Engines to benchmark', dest='engines')
+    parser.add_argument('-n', '--features', nargs='+', type=int, default=[10, 100], help='Number of feature files', dest='features')
+    parser.add_argument('-s', '--steps', nargs='+', type=int, default=[9, 30], help='Steps per scenario', dest='steps')
+    parser.add_argument('-r', '--rows', nargs='+', type=int, default=[0, 100], help='Scenario Outline example rows', dest='rows')
+    parser.add_argument('-x', '--extra-steps', nargs='+', type=int, default=[0, 500], help='Synthetic step definitions added to the registry', dest='extra_steps')
+    parser.add_argument('--seed', type=int, default=0, help='Corpus random seed', dest='seed')
+    parser.add_argument('-o', '--output', default='feature_verifier_benchmark.json', help='JSON results file', dest='output')
+    parser.add_argument('-b', '--baseline', default=None, help='JSON results of a previous run to compare with', dest='baseline')
+    parser.add_argument('-t', '--threshold', type=float, default=20.0, help='Allowed throughput loss against baseline, in percent', dest='threshold')
+    parser.add_argument('-d', '--debug', action='store_true', default=False, help='Show debug logging', dest='debug')
+
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO)
+
+    return args
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+'''Stability trends of the CL2 summary history kept by yamlToXlsx.py --history'''
+import json
+import sqlite3
+from argparse import ArgumentParser
+from datetime import datetime
+import numpy as np
+
+# Runs in the rolling windows, as the "last 10 executions" workbook column
+WINDOW = 10
+# Minimum mean shift, in standard errors, to report a change point
+CHANGE_THRESHOLD = 4.0
+# Drop of the last window stability (or rise of a suite failure rate) against the previous window flagged as regression
+REGRESSION_DROP = 0.05
+
+TRENDS_SHEET = "CL2 Trends"
+BLOCK_KEYS = ('sheet', 'cluster', 'security', 'ipver')
+SUITE_SUFFIX = " TS Failures"
+# Trends sheet columns holding a ratio, the window size suffix ignored
+PERCENT_COLUMNS = ('Stability', 'Rolling stability', 'Mean stability', 'Failure rate', 'Recent failure rate')
+
+
+def parse_arguments():
+    '''Read and parse paramaters received in the command line'''
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('-d', '--history', required=True, help='SQLite history file written by yamlToXlsx.py --history')
+    parser.add_argument('-o', '--output', default='stability_trends.json', help='JSON summary file')
+    parser.add_argument('-w', '--workbook', help=f"XLSX file where the '{TRENDS_SHEET}' sheet is written")
+    parser.add_argument('--window', type=int, default=WINDOW, help='Runs in the rolling windows')
+    return parser.parse_args()
+
+
+def load_history(conn: sqlite3.Connection) -> list:
+    '''Runs of every block (sheet, cluster, security, IP version) with their metrics as a runs x metrics array'''
+    runs = conn.execute("SELECT id, sheet, cluster, security, ipver, execution_date, build, ccsm_drop FROM runs "
+                        "ORDER BY sheet, cluster, security, ipver, execution_date, id").fetchall()
+    if not runs:
+        return []
+    ids = np.array([run[0] for run in runs])
+    metrics = conn.execute("SELECT run_id, name, value FROM metrics").fetchall()
+    names, columns = np.unique(np.array([metric[1] for metric in metrics], dtype=object), return_inverse=True)
+    order = np.argsort(ids)
+    rows = order[np.searchsorted(ids, [metric[0] for metric in metrics], sorter=order)]
+    values = np.full((len(runs), len(names)), np.nan)
+    values[rows, columns] = np.array([metric[2] for metric in metrics], dtype=float)
+
+    blocks = []
+    keys = [run[1:5] for run in runs]
+    bounds = [0] + [index for index in range(1, len(runs)) if keys[index] != keys[index-1]] + [len(runs)]
+    for first, last in zip(bounds, bounds[1:]):
+        block = dict(zip(BLOCK_KEYS, keys[first]))
+        block['dates'] = [run[5] for run in runs[first:last]]
+        block['builds'] = [run[6] for run in runs[first:last]]
+        block['drops'] = [run[7] for run in runs[first:last]]
+        block['metrics'] = {name: values[first:last, column] for column, name in enumerate(names)}
+        blocks.append(block)
+    return blocks
+
+
+def rolling_mean(values: np.ndarray, window: int) -> np.ndarray:
+    '''Mean of the last window values of every position along the first axis, ignoring NaN'''
+    valid = ~np.isnan(values)
+    zeros = np.zeros((1,) + values.shape[1:])
+    sums = np.concatenate((zeros, np.cumsum(np.where(valid, values, 0.0), axis=0)))
+    counts = np.concatenate((zeros, np.cumsum(valid, axis=0)))
+    start = np.maximum(np.arange(1, len(values)+1) - window, 0)
+    total = sums[1:] - sums[start]
+    count = counts[1:] - counts[start]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(count > 0, total / np.maximum(count, 1), np.nan)
+
+
+def change_points(values: np.ndarray, window: int, threshold: float = CHANGE_THRESHOLD) -> list:
+    '''Indexes where the mean of the next window differs from the mean of the previous one'''
+    series = values[~np.isnan(values)]
+    positions = np.flatnonzero(~np.isnan(values))
+    if len(series) < 2 * window:
+        return []
+    sums = np.concatenate(([0.0], np.cumsum(series)))
+    squares = np.concatenate(([0.0], np.cumsum(series ** 2)))
+    index = np.arange(window, len(series) - window + 1)
+    before = (sums[index] - sums[index - window]) / window
+    after = (sums[index + window] - sums[index]) / window
+    shift = np.abs(after - before)
+    # Noise of the whole series, from consecutive differences so that a few steps barely inflate it,
+    # or of the two windows when noisier (failure rates are more scattered once stability drops)
+    local = ((squares[index] - squares[index - window]) / window - before ** 2 +
+             (squares[index + window] - squares[index]) / window - after ** 2) / 2
+    sigma = np.maximum(np.std(np.diff(series)) / np.sqrt(2), np.sqrt(np.maximum(local, 0)))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        score = shift / (sigma * np.sqrt(2 / window))
+    candidates = index[score > threshold]
+    points = []
+    for candidate in sorted(candidates, key=lambda point: -shift[point - window]):
+        if all(abs(candidate - point) >= window for point in points):
+            points.append(candidate)
+    return [int(positions[point]) for point in sorted(points)]
+
+
+def nanmean(values: np.ndarray) -> np.ndarray:
+    '''Mean along the first axis ignoring NaN, NaN (without warning) where every value is NaN'''
+    valid = ~np.isnan(values)
+    count = valid.sum(axis=0)
+    total = np.where(valid, values, 0.0).sum(axis=0)
+    return np.where(count > 0, total / np.maximum(count, 1), np.nan)
+
+
+def rounded(value, digits: int = 4):
+    '''JSON friendly float: rounded, None for NaN'''
+    value = float(value)
+    return None if np.isnan(value) else round(value, digits)
+
+
+def analyse_block(block: dict, window: int) -> dict:
+    '''Stability, per suite failure rates, change points and regression flags of a block'''
+    metrics = block['metrics']
+    empty = np.full(len(block['builds']), np.nan)
+    total = metrics.get('Total Number of TCs', empty)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        stability = np.where(total > 0, 1 - np.nan_to_num(metrics.get('Failed TCs (unstable)', empty)) / total, np.nan)
+    rolling = rolling_mean(stability, window)
+    last, previous = nanmean(stability[-window:]), nanmean(stability[-2*window:-window])
+
+    suites = sorted(name for name in metrics if name.endswith(SUITE_SUFFIX))
+    suite_failures = np.column_stack([metrics[name] for name in suites]) if suites else np.empty((len(stability), 0))
+    failed = np.where(np.isnan(suite_failures), np.nan, suite_failures > 0)
+    rate, recent, earlier = nanmean(failed), nanmean(failed[-window:]), nanmean(failed[-2*window:-window])
+    mean_failures = nanmean(suite_failures)
+    with np.errstate(invalid='ignore'):
+        suite_regression = recent - earlier > REGRESSION_DROP
+
+    summary = {key: block[key] for key in BLOCK_KEYS}
+    summary.update({
+        'runs': len(block['builds']),
+        'first_date': block['dates'][0],
+        'last_date': block['dates'][-1],
+        'last_build': block['builds'][-1],
+        'last_drop': block['drops'][-1],
+        'stability': rounded(stability[-1]),
+        'rolling_stability': rounded(rolling[-1]),
+        'mean_stability': rounded(nanmean(stability)),
+        'regression': bool(previous - last > REGRESSION_DROP),
+        'change_points': [{'build': block['builds'][point], 'date': block['dates'][point], 'drop': block['drops'][point],
+                           'before': rounded(nanmean(stability[max(point-window, 0):point])),
+                           'after': rounded(nanmean(stability[point:point+window]))}
+                          for point in change_points(stability, window)],
+        'suites': {name[:-len(SUITE_SUFFIX)]: {'failure_rate': rounded(rate[column]),
+                                               'recent_failure_rate': rounded(recent[column]),
+                                               'mean_failures': rounded(mean_failures[column]),
+                                               'regression': bool(suite_regression[column])}
+                   for column, name in enumerate(suites)},
+    })
+    return summary
+
+
+def analyse(conn: sqlite3.Connection, window: int = WINDOW) -> dict:
+    '''Trend summary of every block of the history store'''
+    return {'generated': datetime.now().isoformat(timespec='seconds'),
+            'window': window,
+            'blocks': [analyse_block(block, window) for block in load_history(conn)]}
+
+
+def append_table(sheet, header: list, rows: list) -> None:
+    '''Append a header and its rows to the sheet, showing the ratio columns as percentages'''
+    sheet.append(header)
+    percent_columns = [index for index, name in enumerate(header, 1) if name.split(' (')[0] in PERCENT_COLUMNS]
+    for values in rows:
+        sheet.append(values)
+        for index in percent_columns:
+            sheet.cell(row=sheet.max_row, column=index).number_format = '0.0%'
+
+
+def write_trends_sheet(workbook, summary: dict) -> None:
+    '''Replace the trends sheet of an openpyxl workbook with the summary values'''
+    if TRENDS_SHEET in workbook.sheetnames:
+        del workbook[TRENDS_SHEET]
+    sheet = workbook.create_sheet(TRENDS_SHEET)
+    append_table(sheet, ['Sheet', 'Cluster', 'Security', 'IP version', 'Runs', 'Last date', 'Last build', 'Last drop', 'Stability',
+                         f"Rolling stability ({summary['window']})", 'Mean stability', 'Regression', 'Change points (build)'],
+                 [[block[key] for key in BLOCK_KEYS] +
+                  [block['runs'], block['last_date'], block['last_build'], block['last_drop'], block['stability'],
+                   block['rolling_stability'], block['mean_stability'], 'YES' if block['regression'] else '',
+                   ', '.join(str(point['build']) for point in block['change_points'])]
+                  for block in summary['blocks']])
+    sheet.append([])
+    append_table(sheet, ['Sheet', 'Cluster', 'Security', 'IP version', 'Test suite', 'Failure rate',
+                         f"Recent failure rate ({summary['window']})", 'Mean failures', 'Regression'],
+                 [[block[key] for key in BLOCK_KEYS] +
+                  [suite, stats['failure_rate'], stats['recent_failure_rate'], stats['mean_failures'],
+                   'YES' if stats['regression'] else '']
+                  for block in summary['blocks'] for suite, stats in block['suites'].items()])
+
+
+def write_summary(summary: dict, path: str) -> None:
+    '''Store the summary as compact JSON'''
+    with open(path, 'w') as fp:
+        json.dump(summary, fp, separators=(',', ':'))
+
+
+############
+#   MAIN   #
+############
+if __name__ == '__main__':
+    params = parse_arguments()
+    history = sqlite3.connect(f"file:{params.history}?mode=ro", uri=True)
+    trends = analyse(history, params.window)
+    history.close()
+    print(f"[INFO] {len(trends['blocks'])} block(s) analysed, summary stored in '{params.output}'")
+    write_summary(trends, params.output)
+    if params.workbook:
+        import openpyxl
+        book = openpyxl.load_workbook(params.workbook)
+        write_trends_sheet(book, trends)
+        book.save(params.workbook)
+        print(f"[INFO] '{TRENDS_SHEET}' sheet written to '{params.workbook}'")
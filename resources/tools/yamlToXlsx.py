@@ -1,15 +1,34 @@
 #!/usr/bin/env python3
+import os
 import sys
+import copy
+import glob
+import re
+import json
+import math
+import bisect
+import time
+import uuid
+import random
+import shutil
+import tempfile
+import sqlite3
+import zipfile
+import posixpath
 from argparse import ArgumentParser, Namespace
 from datetime import datetime
+from xml.etree import ElementTree
+from xml.sax import parse as sax_parse
+from xml.sax.handler import ContentHandler
+from xml.sax.saxutils import escape, unescape
 import yaml
 import requests
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
 import openpyxl
 from openpyxl.workbook import Workbook
 from openpyxl.worksheet.worksheet import Worksheet
 from openpyxl.utils import get_column_letter, column_index_from_string
-from openpyxl.styles import Font, PatternFill, Alignment
 from openpyxl.styles.builtins import percent
 
 # Find data to add (Ansible and IBD)
@@ -62,15 +81,30 @@ START_COLUMN = {
     }
 }
 
-GREEN = "00b050"
-BLUE  = "1f4e79"
-WHITE = "FFFFFF"
+CONFLUENCE_URL = "https://eteamspace.internal.ericsson.com"
+DEFAULT_CACHE_DIR = os.path.expanduser("~/.cache/yamlToXlsx")
+
+# Confluence HTTP client: connect/read timeouts (seconds), retries of transient failures and backoff base (seconds)
+HTTP_TIMEOUT = (10, 120)
+HTTP_RETRIES = 4
+HTTP_BACKOFF = 1.0
+HTTP_RETRY_STATUS = (429, 500, 502, 503, 504)
+CHUNK_SIZE = 64 * 1024
+
+# Hidden sheet caching the layout of every sheet: "sheet name | block start column | next free row"
+
+MAX_COLUMN = 16384
+XLSX_MAIN_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+XLSX_REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
 
 
 def parse_arguments():
     '''Read and parse paramaters received in the command line'''
     parser = ArgumentParser(description=__doc__)
-    parser.add_argument('-i', '--input', default='summary_results.yaml', help='Yaml file including JCAT TC results')
+    parser.add_argument('-i', '--input', action='append', help='Yaml file including JCAT TC results, as FILE[:clear|:mtls][:ipv6|:ipv4] '
+                        'to override --clear/--ipv6 for that file. Can be repeated (default: summary_results.yaml)')
+    parser.add_argument('--backfill', action='append', default=[], help='Glob pattern of historical Yaml files to replay in execution date order, '
+                        'as PATTERN[:clear|:mtls][:ipv6|:ipv4]. Can be repeated')
     parser.add_argument('-n', '--filename', default="NFT_Automation_TCs.xlsx", help='Confluence attachment XLSX file name to update')
     parser.add_argument('-o', '--pageid', default="814408112", help='Confluence page ID where files are attached')
     parser.add_argument('--clear', action='store_true', help='Clear HTTP')
@@ -78,38 +112,344 @@ def parse_arguments():
     parser.add_argument('-u', '--userid', default='esdccci', help='UserID to access target URL Rest API')
     parser.add_argument('-p', '--password', default='', help='Password to access target URL Rest API')
     parser.add_argument('--dry-run', action='store_true', help='Do not post result to Confluence')
+    parser.add_argument('--url', default=CONFLUENCE_URL, help='Confluence base URL')
+    parser.add_argument('--timeout', type=float, default=HTTP_TIMEOUT[1], help='Seconds to wait for Confluence data before retrying')
+    parser.add_argument('--retries', type=int, default=HTTP_RETRIES, help='Times a failed Confluence request is retried')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help='Directory where downloaded attachments are cached')
+    parser.add_argument('--no-cache', action='store_true', help='Always download the attachment')
+    parser.add_argument('--history', help='SQLite file where every summary record is also stored')
+    parser.add_argument('--from-history', action='store_true', help='Add the records kept in --history instead of the input files ones '
+                        '(input files are still stored first)')
+    parser.add_argument('--since', help='With --from-history, only records executed on or after this date (YYYY-MM-DD)')
+    parser.add_argument('--trends', help='With --history, JSON file where the stability trends computed by stabilityTrends.py are stored, '
+                        'also written to the workbook unless --patch is used')
+    parser.add_argument('--update-existing', action='store_true', help='Overwrite the row of a build already in the workbook instead of skipping it')
+    parser.add_argument('--patch', action='store_true', help='Rewrite only the updated worksheets instead of loading and saving the whole workbook')
     args = parser.parse_args()
+    if (args.from_history or args.trends) and not args.history:
+        parser.error('--from-history and --trends require --history')
+    if not args.input and not args.backfill and not args.from_history:
+        args.input = ['summary_results.yaml']
     return args
 
 
+def parse_input_spec(spec: str, clear: bool, ipv6: bool) -> tuple:
+    '''Split a "FILE[:clear|:mtls][:ipv6|:ipv4]" input into (file, clear, ipv6)'''
+    flags = {'clear': ('clear', True), 'mtls': ('clear', False), 'ipv6': ('ipv6', True), 'ipv4': ('ipv6', False)}
+    options = {'clear': clear, 'ipv6': ipv6}
+    path, *modifiers = spec.split(':')
+    for modifier in modifiers:
+        if modifier.lower() not in flags:
+            raise ValueError(f"Unknown input modifier '{modifier}' in '{spec}'")
+        name, value = flags[modifier.lower()]
+        options[name] = value
+    return path, options['clear'], options['ipv6']
+
+
+def read_records(path: str, clear: bool, ipv6: bool) -> list:
+    '''Load a summary Yaml file as (sheet name, data, clear, ipv6) records'''
+    with open(path) as fp:
+        data = yaml.safe_load(fp) or {}
+    return [(item, data[item], clear, ipv6) for item in data]
+
+
+def read_inputs(parms: Namespace) -> list:
+    '''Records of every backfill file, oldest first, followed by the records of every input file'''
+    backfill = []
+    for spec in parms.backfill:
+        pattern, clear, ipv6 = parse_input_spec(spec, parms.clear, parms.ipv6)
+        for path in sorted(glob.glob(pattern, recursive=True)):
+            backfill.extend(read_records(path, clear, ipv6))
+    backfill.sort(key=lambda record: str(record[1].get('Execution Date', '')))
+    records = backfill
+    for spec in parms.input or []:
+        records.extend(read_records(*parse_input_spec(spec, parms.clear, parms.ipv6)))
+    return records
+
+
+HISTORY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    sheet TEXT NOT NULL,
+    cluster TEXT NOT NULL,
+    security TEXT NOT NULL,
+    ipver TEXT NOT NULL,
+    environment TEXT,
+    execution_date TEXT,
+    build TEXT NOT NULL,
+    ccsm_drop TEXT,
+    ccsm_version TEXT,
+    record TEXT NOT NULL,
+    UNIQUE (sheet, cluster, security, ipver, build)
+);
+CREATE INDEX IF NOT EXISTS runs_date ON runs (execution_date);
+CREATE INDEX IF NOT EXISTS runs_block ON runs (sheet, cluster, security, ipver, execution_date);
+CREATE TABLE IF NOT EXISTS metrics (
+    run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    value REAL,
+    PRIMARY KEY (name, run_id)
+) WITHOUT ROWID;
+"""
+
+
+def open_history(path: str) -> sqlite3.Connection:
+    '''Open (creating it if needed) the SQLite history store'''
+    conn = sqlite3.connect(path)
+    conn.executescript(HISTORY_SCHEMA)
+    return conn
+
+
+def record_block(data_item: dict, clear: bool, ipv6: bool) -> tuple:
+    '''(cluster, security, IP version) of a record, as used by START_COLUMN'''
+    cluster = 'ansible' if '-ans-' in data_item['environment'] else 'IBD'
+    return cluster, 'CLEAR' if clear else 'mTLS', 'IPv6' if ipv6 else 'IPv4'
+
+
+def metric_value(value):
+    '''Numeric value of a summary field: None if empty, False if not a number'''
+    if value in (None, ''):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return False
+
+
+def store_history(conn: sqlite3.Connection, records: list) -> int:
+    '''Add records to the history store, ignoring builds already stored, and return how many were added'''
+    added = 0
+    with conn:
+        for item, data_item, clear, ipv6 in records:
+            date = data_item.get('Execution Date')
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO runs (sheet, cluster, security, ipver, environment, execution_date, build, ccsm_drop, ccsm_version, record) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (item, *record_block(data_item, clear, ipv6), data_item.get('environment'),
+                 date.isoformat(' ') if isinstance(date, datetime) else date, str(data_item.get('Build number')),
+                 data_item.get('CCSM Drop'), data_item.get('CCSM Version'), yaml.safe_dump(data_item)))
+            if not cursor.rowcount:
+                continue
+            added += 1
+            metrics = [(cursor.lastrowid, name, metric_value(value)) for name, value in data_item.items()]
+            conn.executemany("INSERT INTO metrics (run_id, name, value) VALUES (?, ?, ?)",
+                             [metric for metric in metrics if metric[2] is not False])
+    return added
+
+
+def history_records(conn: sqlite3.Connection, since: str = None) -> list:
+    '''Stored records, oldest first, as (sheet name, data, clear, ipv6) records'''
+    query = "SELECT sheet, security, ipver, record FROM runs"
+    parameters = ()
+    if since:
+        query += " WHERE execution_date >= ?"
+        parameters = (since,)
+    query += " ORDER BY execution_date, id"
+    return [(sheet, yaml.safe_load(record), security == 'CLEAR', ipver == 'IPv6')
+            for sheet, security, ipver, record in conn.execute(query, parameters)]
+
+
+class MultipartFile:
+    '''multipart/form-data body streaming a file from disk, one chunk at a time'''
+
+    def __init__(self, field: str, path: str):
+        boundary = uuid.uuid4().hex
+        self.path = path
+        self.content_type = f"multipart/form-data; boundary={boundary}"
+        self.head = (f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{os.path.basename(path)}"\r\n'
+                     'Content-Type: application/octet-stream\r\n\r\n').encode()
+        self.tail = f"\r\n--{boundary}--\r\n".encode()
+        self.size = len(self.head) + os.path.getsize(path) + len(self.tail)
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        yield self.head
+        with open(self.path, 'rb') as fp:
+            for chunk in iter(lambda: fp.read(CHUNK_SIZE), b''):
+                yield chunk
+        yield self.tail
+
+
+def get_session(parms: Namespace) -> requests.Session:
+    '''Keep-alive session shared by every Confluence request of this run'''
+    if getattr(parms, 'session', None) is None:
+        session = requests.Session()
+        session.auth = HTTPBasicAuth(parms.userid, parms.password)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        parms.session = session
+    return parms.session
+
+
+def retry_delay(attempt: int, response: requests.Response = None) -> float:
+    '''Seconds to wait before a retry: Retry-After if the server sent it, else jittered exponential backoff'''
+    if response is not None and response.headers.get('Retry-After', '').isdigit():
+        return float(response.headers['Retry-After'])
+    return random.uniform(0, HTTP_BACKOFF * 2 ** attempt)
+
+
+def confluence_request(parms: Namespace, method: str, url: str, **kwargs) -> requests.Response:
+    '''Send a request through the shared session retrying connection errors, timeouts and 429/5xx answers'''
+    kwargs.setdefault('timeout', (HTTP_TIMEOUT[0], parms.timeout))
+    session = get_session(parms)
+    for attempt in range(parms.retries + 1):
+        response = None
+        try:
+            response = session.request(method, url, **kwargs)
+            if response.status_code not in HTTP_RETRY_STATUS or attempt == parms.retries:
+                return response
+            reason = f"HTTP {response.status_code}"
+            response.close()
+        except (requests.ConnectionError, requests.Timeout) as exc:
+            if attempt == parms.retries:
+                raise
+            reason = type(exc).__name__
+        delay = retry_delay(attempt, response)
+        print(f"[WARNING] {method} {url.split('?')[0]} failed ({reason}), retry {attempt + 1}/{parms.retries} in {delay:.1f}s")
+        time.sleep(delay)
+
+
+def report_transfer(action: str, name: str, size: int, start: float) -> None:
+    '''Print byte count and throughput of a finished transfer'''
+    elapsed = max(time.monotonic() - start, 1e-6)
+    print(f"[INFO] {action} '{name}': {size} bytes in {elapsed:.2f}s ({size / elapsed / 1024:.1f} KiB/s)")
+
+
+def get_attachment_version(parms: Namespace) -> int:
+    '''Current version number of the attachment, None if unknown'''
+    url = f"{parms.url}/rest/api/content/{parms.pageid}/child/attachment"
+    try:
+        response = confluence_request(parms, 'GET', url, params={'filename': parms.filename, 'expand': 'version'})
+        if response.status_code == 200:
+            for attachment in response.json().get('results', []):
+                if attachment.get('title') == parms.filename:
+                    return attachment['version']['number']
+    except (requests.RequestException, ValueError, KeyError, TypeError) as exc:
+        print(f"[WARNING] Cannot get attachment version: {exc}")
+    return None
+
+
+def cache_paths(parms: Namespace) -> tuple:
+    '''Cached attachment file and its metadata file'''
+    name = os.path.join(parms.cache_dir, f"{parms.pageid}_{os.path.basename(parms.filename)}")
+    return name, f"{name}.json"
+
+
+def read_cache(parms: Namespace) -> dict:
+    '''Metadata (version, etag, last_modified) of the cached attachment, empty if not cached'''
+    if parms.no_cache:
+        return {}
+    cached_file, meta_file = cache_paths(parms)
+    try:
+        with open(meta_file) as fp:
+            meta = json.load(fp)
+    except (OSError, ValueError):
+        return {}
+    return meta if os.path.exists(cached_file) else {}
+
+
+def write_cache(parms: Namespace, meta: dict) -> None:
+    '''Store the current attachment file in the cache'''
+    if parms.no_cache:
+        return
+    cached_file, meta_file = cache_paths(parms)
+    try:
+        os.makedirs(parms.cache_dir, exist_ok=True)
+        # Unique temporary names, concurrent jobs sharing the cache must not write the same file
+        fd, tmp_file = tempfile.mkstemp(dir=parms.cache_dir, prefix='.attachment-')
+        os.close(fd)
+        fd, tmp_meta = tempfile.mkstemp(dir=parms.cache_dir, prefix='.meta-')
+        try:
+            with os.fdopen(fd, 'w') as fp:
+                json.dump(meta, fp)
+            shutil.copyfile(parms.filename, tmp_file)
+            os.replace(tmp_file, cached_file)
+            os.replace(tmp_meta, meta_file)
+        finally:
+            for name in (tmp_file, tmp_meta):
+                if os.path.exists(name):
+                    os.remove(name)
+    except OSError as exc:
+        print(f"[WARNING] Cannot cache attachment: {exc}")
+
+
+def download_file(parms: Namespace) -> bool:
+    '''Get a file from an URL using its Rest API, reusing the cached copy when it is still current'''
+    parms.attachment_version = get_attachment_version(parms)
+    meta = read_cache(parms)
+    cached_file, _ = cache_paths(parms)
+    if meta and parms.attachment_version is not None and meta.get('version') == parms.attachment_version:
+        print(f"[INFO] Using cached attachment version {parms.attachment_version}")
+        shutil.copyfile(cached_file, parms.filename)
+        return True
+
+    headers = {}
+    if meta.get('etag'):
+        headers['If-None-Match'] = meta['etag']
+    if meta.get('last_modified'):
+        headers['If-Modified-Since'] = meta['last_modified']
+    url = f"{parms.url}/download/attachments"
+    start = time.monotonic()
+    with confluence_request(parms, 'GET', f"{url}/{parms.pageid}/{parms.filename}?api=v2", headers=headers, stream=True) as response:
+        if response.status_code == 304 and meta:
+            print("[INFO] Cached attachment not modified")
+            shutil.copyfile(cached_file, parms.filename)
+            return True
+        if response.status_code != 200:
+            print(f"[ERROR] Download result: {response.status_code}")
+            return False
+        size = 0
+        with open(f"{parms.filename}.part", 'wb') as fp:
+            for chunk in response.iter_content(CHUNK_SIZE):
+                fp.write(chunk)
+                size += len(chunk)
+        os.replace(f"{parms.filename}.part", parms.filename)
+        report_transfer('Downloaded', parms.filename, size, start)
+        write_cache(parms, {'version': parms.attachment_version,
+                            'etag': response.headers.get('ETag'),
+                            'last_modified': response.headers.get('Last-Modified')})
+    return True
+
+
 def download_workbook(parms: Namespace) -> Workbook:
-    '''Get a file from an URL using its Rest API'''
+    '''Get a workbook from an URL using its Rest API'''
     workbook = None
-    url = "https://eteamspace.internal.ericsson.com/download/attachments"
-    response = requests.get(f"{url}/{parms.pageid}/{parms.filename}?api=v2", auth=HTTPBasicAuth(parms.userid, parms.password))
-    if (response.status_code == 200):
-        with open(parms.filename, 'wb') as fp:
-            fp.write(response.content)
-
+    if download_file(parms):
         workbook = openpyxl.load_workbook(parms.filename)
     return workbook
 
 
 def upload_workbook(parms: Namespace) -> int:
     '''Upload updated XLSX file to Confluence'''
-    url = f"https://eteamspace.internal.ericsson.com/pages/doattachfile.action?pageId={parms.pageid}"
-    headers = {'X-Atlassian-Token': 'no-check'}
-    files = {parms.filename:(parms.filename, open(parms.filename, 'rb'))}
-    res = requests.post(url, headers=headers, auth=HTTPBasicAuth(parms.userid, parms.password), files=files)
+    # Optimistic concurrency: refuse to overwrite a version uploaded after our download
+    expected = getattr(parms, 'attachment_version', None)
+    if expected is not None:
+        current = get_attachment_version(parms)
+        if current != expected:
+            print(f"[ERROR] Attachment changed while updating it (version {expected} -> {current}). Not uploading.")
+            return 1
+    url = f"{parms.url}/pages/doattachfile.action?pageId={parms.pageid}"
+    body = MultipartFile(parms.filename, parms.filename)
+    headers = {'X-Atlassian-Token': 'no-check', 'Content-Type': body.content_type}
+    start = time.monotonic()
+    res = confluence_request(parms, 'POST', url, headers=headers, data=body)
+    if res.status_code >= 400:
+        print(f"[ERROR] Upload result: {res.status_code}")
+        return 1
     print(f"[INFO] Upload result: {res.status_code}")
+    report_transfer('Uploaded', parms.filename, len(body), start)
+    parms.attachment_version = get_attachment_version(parms)
+    if parms.attachment_version is not None:
+        write_cache(parms, {'version': parms.attachment_version})
     return 0
 
 
 def get_columns_to_update(data_item: dict, clear: bool, ipv6: bool) -> list:
     '''Find column range to update'''
-    cluster = 'ansible' if '-ans-' in data_item['environment'] else 'IBD'
-    security = 'CLEAR' if clear else 'mTLS'
-    ipver = 'IPv6' if ipv6 else 'IPv4'
+    cluster, security, ipver = record_block(data_item, clear, ipv6)
 
     cols = [START_COLUMN[cluster][security][ipver]]
 
@@ -121,89 +461,661 @@ def get_columns_to_update(data_item: dict, clear: bool, ipv6: bool) -> list:
 def get_row_to_update(sheet: Worksheet, colinds: list) -> int:
     '''Find row index to update'''
     rowindex = HEADER_ROW+1
-    for row in sheet.iter_rows(HEADER_ROW+1, sheet.max_row+1, column_index_from_string(colinds[0]), column_index_from_string(colinds[1])):
-        if row[0].value in (None, ''):
-            rowindex = row[0].row
+    column = column_index_from_string(colinds[0])
+    for rowindex, row in enumerate(sheet.iter_rows(HEADER_ROW+1, sheet.max_row+1, column, column, values_only=True), HEADER_ROW+1):
+        if row[0] in (None, ''):
             break
     return rowindex
 
 
+def block_starts() -> list:
+    '''Sorted column indexes where a START_COLUMN block begins'''
+    return sorted({column_index_from_string(letter)
+                   for security in START_COLUMN.values()
+                   for ipver in security.values()
+                   for letter in ipver.values() if letter})
+
+
+def block_end(start: int) -> int:
+    '''Last column index of the START_COLUMN block beginning at start'''
+    following = [column for column in block_starts() if column > start]
+    return following[0]-1 if following else MAX_COLUMN
+
+
+def get_sheet_layout(sheet: Worksheet, letters: set) -> dict:
+    '''Map header names to column indexes and find the next free row of the wanted START_COLUMN blocks'''
+    header = next(sheet.iter_rows(HEADER_ROW, HEADER_ROW, values_only=True), ())
+    layout = {}
+    for letter in letters:
+        start = column_index_from_string(letter)
+        columns = {}
+        for column in range(start, min(block_end(start), len(header))+1):
+            name = header[column-1]
+            if name not in (None, '') and name not in columns:
+                columns[name] = column
+        next_row = get_row_to_update(sheet, [letter])
+        layout[letter] = {'columns': columns, 'next_row': next_row,
+                          'builds': index_builds(sheet, columns.get("Build number"), next_row)}
+    return layout
+
+
+def build_key(value) -> str:
+    '''Build number as compared between Yaml records and workbook cells'''
+    return str(value).strip()
+
+
+def index_builds(sheet: Worksheet, column: int, next_row: int) -> dict:
+    '''Map the build numbers of a block to their row, reading its "Build number" column once'''
+    if not column or next_row <= HEADER_ROW+1:
+        return {}
+    values = sheet.iter_rows(HEADER_ROW+1, next_row-1, column, column, values_only=True)
+    return {build_key(row[0]): rowind for rowind, row in enumerate(values, HEADER_ROW+1) if row[0] not in (None, '')}
+
+
 def total_stable_percent_cell(sheet: Worksheet, data_item: dict, colinds: list, rowind: int) -> None:
-    '''Set format and value for "Stability CL2 (stable/Total)" cell'''
+    '''Set value for "Stability CL2 (stable/Total)" cell'''
     totNum = data_item['Total Number of TCs']
     failTcs = data_item['Failed TCs (unstable)']
     cellIndex = f"{get_column_letter(column_index_from_string(colinds[1]))}{rowind}"
     sheet[cellIndex].value = f"=1-({failTcs}/{totNum})"
-    sheet[cellIndex].number_format = '0.0%'
-    sheet[cellIndex].fill = PatternFill("solid", fgColor=GREEN)
-    sheet[cellIndex].font = Font(name='Calibri', size=11, color=WHITE)
 
 
 def average_stable_percent_cell(sheet: Worksheet, colinds: list, rowind: int) -> None:
-    '''Set format and value for "Stability CL2 Rolling average (last 10 executions)" cell'''
+    '''Set value for "Stability CL2 Rolling average (last 10 executions)" cell'''
     avgFirst = f"{get_column_letter(column_index_from_string(colinds[1]))}{rowind-10}"
     avgLast  = f"{get_column_letter(column_index_from_string(colinds[1]))}{rowind}"
     cellIndex = f"{get_column_letter(column_index_from_string(colinds[1])+1)}{rowind}"
     sheet[cellIndex].value = f"=AVERAGE({avgFirst},{avgLast})"
-    sheet[cellIndex].number_format = '0.0%'
-    sheet[cellIndex].fill = PatternFill("solid", fgColor=BLUE)
-    sheet[cellIndex].font = Font(name='Calibri', size=11, color="FFFFFF")
 
 
-############
-#   MAIN   #
-############
-if __name__ == '__main__':
-    result = 0
-    params = parse_arguments()
-    print("[INFO] Reading Jenkins build data")
-    data = yaml.safe_load(open(params.input))
-    cancel = False
+def inherit_row_style(sheet: Worksheet, columns: list, last_row: int, rowind: int) -> None:
+    '''Format the updated cells of a row like the last filled row of their block, as the patch engine does'''
+    if last_row <= HEADER_ROW:
+        return
+    for column in columns:
+        sheet.cell(rowind, column)._style = copy.copy(sheet.cell(last_row, column)._style)
 
-    print(f"[INFO] Opening workbook: '{params.filename}'")
-    workbook = download_workbook(params)
 
-    for item in data:
+def update_workbook(workbook: Workbook, records: list, update_existing: bool = False) -> bool:
+    '''Append the summary rows to a loaded workbook, return True if cancelled (nothing to change)'''
+    wanted = {}
+    for item, data_item, clear, ipv6 in records:
+        wanted.setdefault(item, set()).add(get_columns_to_update(data_item, clear, ipv6)[0])
+    layouts = {}
+    changed = False
+    for item, data_item, clear, ipv6 in records:
         print(f"[INFO] Processing spreadsheet: '{item}'")
-        sheet = workbook.get_sheet_by_name(item)
+        sheet = workbook[item]
 
         print("[INFO] Locating cell indexes to update")
-        colindexes = get_columns_to_update(data[item], params.clear, params.ipv6)
-        rowindex = get_row_to_update(sheet, colindexes)
-
-        print("[INFO] Updating cells")
-        for col in sheet.iter_cols(min_row=HEADER_ROW, max_row=HEADER_ROW,
-                                   min_col=column_index_from_string(colindexes[0]),
-                                   max_col=column_index_from_string(colindexes[1])):
-            for cell in col:
-                if cell.value == "Build number":
-                    if sheet[f"{get_column_letter(cell.column)}{rowindex-1}"] == data[item][cell.value]:
-                        print("[WARNING] Data seems to be already included. Aborting.")
-                        cancel = True
-                        break
-                if cell.value == "Cumulative Number of executions":
-                    prev_row = rowindex-1 if rowindex > HEADER_ROW+1 else HEADER_ROW+1
-                    sheet[f"{get_column_letter(cell.column)}{rowindex}"] = int(sheet[f"{get_column_letter(cell.column)}{prev_row}"].value)+1
-                elif cell.value in data[item]:
-                    value = data[item][cell.value] if data[item][cell.value] != "" else "-"
-                    if 'date' in cell.value.lower():
-                        value = datetime.strptime(datetime.strftime(value, '%Y/%d/%m %H:%M:%S'), '%Y/%d/%m %H:%M:%S')
-                        sheet[f"{get_column_letter(cell.column)}{rowindex}"].number_format = 'd-mmm'
+        colindexes = get_columns_to_update(data_item, clear, ipv6)
+        if item not in layouts:
+            layouts[item] = get_sheet_layout(sheet, wanted[item])
+        block = layouts[item][colindexes[0]]
+        build = build_key(data_item.get("Build number"))
+        rowindex = block['builds'].get(build)
+        if rowindex is not None and not update_existing:
+            print(f"[WARNING] Build {build} already included in row {rowindex}. Skipping.")
+            continue
+        existing = rowindex is not None
+        rowindex = rowindex or block['next_row']
+        lastcol = column_index_from_string(colindexes[1])
+
+        print(f"[INFO] Updating cells of row {rowindex}")
+        updated = [lastcol, lastcol+1]
+        for name, column in block['columns'].items():
+            if column > lastcol:
+                continue
+            if name == "Cumulative Number of executions":
+                if existing:
+                    continue
+                prev_row = rowindex-1 if rowindex > HEADER_ROW+1 else HEADER_ROW+1
+                sheet[f"{get_column_letter(column)}{rowindex}"] = int(sheet[f"{get_column_letter(column)}{prev_row}"].value)+1
+                updated.append(column)
+            elif name in data_item:
+                value = data_item[name] if data_item[name] != "" else "-"
+                if 'date' in name.lower():
+                    value = datetime.strptime(datetime.strftime(value, '%Y/%d/%m %H:%M:%S'), '%Y/%d/%m %H:%M:%S')
+                sheet[f"{get_column_letter(column)}{rowindex}"] = value
+                updated.append(column)
+        total_stable_percent_cell(sheet, data_item, colindexes, rowindex)
+        average_stable_percent_cell(sheet, colindexes, rowindex)
+        inherit_row_style(sheet, updated, block['next_row']-1, rowindex)
+        changed = True
+        if not existing:
+            block['builds'][build] = rowindex
+            block['next_row'] = rowindex+1
+    if not changed:
+        print("[WARNING] Every build is already included. Nothing to update.")
+        return True
+    return False
+
+
+def patch_workbook(filename: str, records: list, update_existing: bool = False) -> bool:
+    '''Append the summary rows rewriting only the worksheet parts of the updated sheets, return True if cancelled (nothing to change)'''
+    with zipfile.ZipFile(filename) as package:
+        parts = get_package_parts(package)
+        wanted = {}
+        for item, data_item, clear, ipv6 in records:
+            first = column_index_from_string(get_columns_to_update(data_item, clear, ipv6)[0])
+            wanted.setdefault(parts['sheets'][item], set()).add(first)
+        print(f"[INFO] Locating cell indexes to update in {', '.join(sorted(wanted))}")
+        blocks = scan_blocks(package, parts, wanted)
+        patches = {}
+        for item, data_item, clear, ipv6 in records:
+            part = parts['sheets'][item]
+            colindexes = get_columns_to_update(data_item, clear, ipv6)
+            first = column_index_from_string(colindexes[0])
+            last = column_index_from_string(colindexes[1])
+            block = blocks[(part, first)]
+            header = {name: column for name, column in block['header'].items() if column <= last}
+            build = build_key(data_item.get("Build number"))
+            rowind = block['builds'].get(build)
+            if rowind is not None and not update_existing:
+                print(f"[WARNING] Build {build} already included in row {rowind}. Skipping.")
+                continue
+
+            if rowind is None:
+                rowind = block['next_row']
+                cells = summary_cells(data_item, header, block['previous'], block['styles'], colindexes, rowind, parts['date1904'])
+                block['previous'] = {column: value for column, _, value, _ in cells}
+                block['builds'][build] = rowind
+                block['next_row'] = rowind+1
+            else:
+                # Overwritten in place keeping its number of executions, formatted as the last row
+                header.pop("Cumulative Number of executions", None)
+                cells = summary_cells(data_item, header, {}, block['styles'], colindexes, rowind, parts['date1904'])
+            # Blocks of the same sheet share rows, a cell written twice keeps its last value
+            patches.setdefault(part, {}).setdefault(rowind, {}).update((cell[0], cell) for cell in cells)
+
+        if not patches:
+            print("[WARNING] Every build is already included. Nothing to update.")
+            return True
+        print(f"[INFO] Patching worksheet parts: {', '.join(patches)}")
+        output_name = f"{filename}.tmp"
+        with zipfile.ZipFile(output_name, 'w', zipfile.ZIP_DEFLATED) as output:
+            for info in package.infolist():
+                with package.open(info) as source, output.open(copy.copy(info), 'w') as target:
+                    if info.filename in patches:
+                        patch_sheet_part(source, target, {rowind: list(cells.values())
+                                                          for rowind, cells in patches[info.filename].items()})
                     else:
-                        sheet[f"{get_column_letter(cell.column)}{rowindex}"].alignment = Alignment(horizontal="center")
-                    sheet[f"{get_column_letter(cell.column)}{rowindex}"] = value
-            if cancel:
+                        shutil.copyfileobj(source, target)
+    os.replace(output_name, filename)
+    return False
+
+
+def scan_blocks(package: zipfile.ZipFile, parts: dict, wanted: dict) -> dict:
+    '''
+    Header columns, next free row, last filled row (values and styles) and build numbers index of the wanted
+    blocks ({part: block first columns}) by (part, first column), reading every part once
+    '''
+    def header_names(header: dict) -> dict:
+        strings = read_shared_strings(package, parts['sharedStrings'], SheetScanner.shared_indexes([header]))
+        return {column: cell_value(cell, strings) for column, cell in header.items()}
+
+    scans = {part: scan_sheet_part(package, part, {first: block_end(first) for first in firsts}, header_names)
+             for part, firsts in wanted.items()}
+    previous = {(part, first): scan.previous(first) for part, scan in scans.items() for first in scan.blocks}
+    indexes = SheetScanner.shared_indexes(list(previous.values()) + [scan.builds[first] for scan in scans.values() for first in scan.blocks])
+    strings = read_shared_strings(package, parts['sharedStrings'], indexes)
+
+    blocks = {}
+    for part, scan in scans.items():
+        for first, last in scan.blocks.items():
+            header = {}
+            for column, name in sorted(scan.names.items()):
+                if first <= column <= last:
+                    header.setdefault(name, column)
+            builds = {}
+            for rowind, cell in scan.builds[first].items():
+                value = cell_value(cell, strings)
+                if value not in (None, ''):
+                    builds[build_key(value)] = rowind
+            cells = previous[(part, first)]
+            blocks[(part, first)] = {
+                'header': header,
+                'previous': {column: cell_value(cell, strings) for column, cell in cells.items()},
+                'styles': {column: cell[1] for column, cell in cells.items()},
+                'builds': builds,
+                'next_row': scan.next_row[first],
+            }
+    return blocks
+
+
+def get_package_parts(package: zipfile.ZipFile) -> dict:
+    '''Locate worksheet parts by sheet name and the shared strings part of an XLSX package'''
+    targets = {}
+    shared_strings = None
+    for rel in ElementTree.fromstring(package.read('xl/_rels/workbook.xml.rels')):
+        target = rel.get('Target')
+        target = target.lstrip('/') if target.startswith('/') else posixpath.normpath(posixpath.join('xl', target))
+        targets[rel.get('Id')] = target
+        if rel.get('Type', '').endswith('/sharedStrings'):
+            shared_strings = target
+
+    workbook_xml = ElementTree.fromstring(package.read('xl/workbook.xml'))
+    sheets = {sheet.get('name'): targets[sheet.get(f'{{{XLSX_REL_NS}}}id')]
+              for sheet in workbook_xml.iter(f'{{{XLSX_MAIN_NS}}}sheet')}
+    properties = workbook_xml.find(f'{{{XLSX_MAIN_NS}}}workbookPr')
+    date1904 = properties is not None and properties.get('date1904') in ('1', 'true')
+    return {'sheets': sheets, 'sharedStrings': shared_strings, 'date1904': date1904}
+
+
+def local_name(qname: str) -> str:
+    '''XML element name without namespace prefix'''
+    return qname.rpartition(':')[2]
+
+
+class StopScan(Exception):
+    '''Everything needed from a worksheet part has been read'''
+
+
+SHEET_DATA_RE = re.compile(rb'<((?:[\w.-]+:)?)sheetData\b[^>]*?(/?)>')
+DIMENSION_RE = re.compile(rb'(<(?:[\w.-]+:)?dimension\b[^>]*?\bref=")([^"]*)(")')
+ROW_ATTR_RE = re.compile(rb'\sr="(\d+)"')
+SPANS_ATTR_RE = re.compile(rb'\sspans="[^"]*"')
+CELL_RE = re.compile(rb'<(?:[\w.-]+:)?c\b[^>]*?(?:/>|>.*?</(?:[\w.-]+:)?c>)', re.DOTALL)
+CELL_PARTS_RE = re.compile(rb'<(?:[\w.-]+:)?c\b(?=[^>]*?\sr="([A-Z]+))([^>]*?)(?:/>|>(.*?)</(?:[\w.-]+:)?c>)', re.DOTALL)
+CELL_REF_RE = re.compile(rb'\sr="([A-Z]+)')
+CELL_TYPE_RE = re.compile(rb'\st="(\w+)"')
+CELL_STYLE_RE = re.compile(rb'\ss="(\d+)"')
+CELL_VALUE_RE = re.compile(rb'<(?:[\w.-]+:)?v>(.*?)</(?:[\w.-]+:)?v>', re.DOTALL)
+CELL_TEXT_RE = re.compile(rb'<(?:[\w.-]+:)?t\b[^>]*>(.*?)</(?:[\w.-]+:)?t>', re.DOTALL)
+XML_ENTITIES = {'&quot;': '"', '&apos;': "'"}
+
+
+class PartReader:
+    '''Incremental regular expression search over a streamed worksheet part'''
+
+    def __init__(self, source):
+        self.source = source
+        self.buffer = b''
+        self.position = 0
+        self.eof = False
+
+    def search(self, pattern, start: int = None):
+        '''Match pattern in the buffer from start (current position by default), reading more of the source until complete'''
+        start = self.position if start is None else start
+        while True:
+            match = pattern.search(self.buffer, start)
+            if match and (match.end() < len(self.buffer) or self.eof):
+                return match
+            if self.eof:
+                return None
+            chunk = self.source.read(CHUNK_SIZE)
+            self.eof = not chunk
+            # Drop what was already consumed, positions become relative to the current position
+            self.buffer = self.buffer[self.position:] + chunk
+            start -= self.position
+            self.position = 0
+
+    def consume(self, end: int) -> bytes:
+        '''Take the buffer from the current position up to end'''
+        data = self.buffer[self.position:end]
+        self.position = end
+        return data
+
+    def rows(self, prefix: bytes):
+        '''
+        Yield (bytes before the row, row number, start tag, content, whole element) of every row from the current
+        position up to the end of sheetData, which is left unread
+        '''
+        prefix = re.escape(prefix)
+        row_start = re.compile(rb'<' + prefix + rb'row\b[^>]*?(/?)>|</' + prefix + rb'sheetData>')
+        row_end = re.compile(rb'</' + prefix + rb'row>')
+        rowind = 0
+        while True:
+            row = self.search(row_start)
+            start_tag = row.group(0)
+            if start_tag.startswith(b'</'):
+                return
+            gap = self.consume(row.start())
+            found = ROW_ATTR_RE.search(start_tag)
+            rowind = int(found.group(1)) if found else rowind+1
+            if row.group(1):
+                content = b''
+                end = self.position + len(start_tag)
+            else:
+                closing = self.search(row_end, self.position + len(start_tag))
+                content = self.buffer[self.position + len(start_tag):closing.start()]
+                end = closing.end()
+            yield gap, rowind, start_tag, content, self.consume(end)
+
+
+class SheetScanner:
+    '''
+    Collect the header row, and the next free row, the build number cells and the last filled row of every block
+    ({first column: last column}) from the rows of a worksheet part. Rows are given as {column: (attributes, content)}
+    and cells are kept as raw (type, style, value) tuples
+    '''
+
+    def __init__(self, blocks: dict, header_names):
+        self.blocks = blocks
+        self.firsts = sorted(blocks)
+        self.header_names = header_names
+        self.header = {}
+        self.names = {}
+        self.build_columns = {}
+        self.builds = {first: {} for first in blocks}
+        self.last_rows = {first: {} for first in blocks}
+        self.next_row = {first: HEADER_ROW+1 for first in blocks}
+        self.pending = set(blocks)
+
+    def in_blocks(self, column: int) -> bool:
+        position = bisect.bisect_right(self.firsts, column)
+        return position > 0 and column <= self.blocks[self.firsts[position-1]]
+
+    def add_row(self, rowind: int, cells: dict) -> bool:
+        '''Record a row, return False once the next free row of every block is known'''
+        if rowind == HEADER_ROW:
+            self.header = {column: raw_cell(*cell) for column, cell in cells.items()}
+            self.names = self.header_names(self.header)
+            for first, last in self.blocks.items():
+                self.build_columns[first] = next((column for column in sorted(self.names)
+                                                  if first <= column <= last and self.names[column] == "Build number"), None)
+        elif rowind > HEADER_ROW:
+            for first in list(self.pending):
+                start = cells.get(first)
+                if rowind == self.next_row[first] and start and raw_cell(*start)[2] != '':
+                    self.last_rows[first] = cells
+                    build = cells.get(self.build_columns.get(first))
+                    if build:
+                        self.builds[first][rowind] = raw_cell(*build)
+                    self.next_row[first] += 1
+                elif rowind >= self.next_row[first]:
+                    self.pending.discard(first)
+        return bool(self.pending)
+
+    def previous(self, first: int) -> dict:
+        '''Cells of the last filled row of a block'''
+        last = self.blocks[first]
+        return {column: raw_cell(*cell) for column, cell in self.last_rows[first].items() if first <= column <= last}
+
+    @staticmethod
+    def shared_indexes(rows: list) -> set:
+        '''Shared string indexes referenced by the cells of some rows'''
+        return {int(cell[2]) for cells in rows for cell in cells.values()
+                if cell[0] == 's' and cell[2] != ''}
+
+
+def scan_sheet_part(package: zipfile.ZipFile, part: str, blocks: dict, header_names) -> SheetScanner:
+    '''
+    Stream a worksheet part until the next free row of every block ({first column: last column}) is known.
+    header_names maps the raw header cells to {column: name}
+    '''
+    scanner = SheetScanner(blocks, header_names)
+    with package.open(part) as contents:
+        reader = PartReader(contents)
+        sheet_data = reader.search(SHEET_DATA_RE)
+        if sheet_data.group(2):
+            # Empty <sheetData/>
+            return scanner
+        reader.consume(sheet_data.end())
+        for _, rowind, _, content, _ in reader.rows(sheet_data.group(1)):
+            cells = {}
+            for letters, attrs, inner in CELL_PARTS_RE.findall(content):
+                column = column_index_from_string(letters.decode())
+                if scanner.in_blocks(column):
+                    cells[column] = (attrs, inner)
+            if not scanner.add_row(rowind, cells):
                 break
+    return scanner
+
+
+def raw_cell(attrs: bytes, inner: bytes) -> tuple:
+    '''(type, style, value) of a cell from its attributes and its content'''
+    kind = CELL_TYPE_RE.search(attrs)
+    style = CELL_STYLE_RE.search(attrs)
+    value = CELL_VALUE_RE.search(inner)
+    text = value.group(1) if value else b''.join(CELL_TEXT_RE.findall(inner))
+    return (kind.group(1).decode() if kind else 'n', style.group(1).decode() if style else None,
+            unescape(text.decode(), XML_ENTITIES))
+
+
+class SharedStringsReader(ContentHandler):
+    '''Collect the text of the requested shared string items only'''
+
+    def __init__(self, indexes: set):
+        super().__init__()
+        self.indexes = indexes
+        self.strings = {}
+        self.position = -1
+        self.text = None
+        self.ignore = 0
+
+    def startElement(self, name, attrs):
+        name = local_name(name)
+        if name == 'si':
+            self.position += 1
+            if self.position > max(self.indexes):
+                raise StopScan()
+            self.text = [] if self.position in self.indexes else None
+        elif name == 'rPh':
+            # Phonetic runs are not part of the displayed text
+            self.ignore += 1
+
+    def endElement(self, name):
+        name = local_name(name)
+        if name == 'si' and self.text is not None:
+            self.strings[self.position] = ''.join(self.text)
+            self.text = None
+        elif name == 'rPh':
+            self.ignore -= 1
+
+    def characters(self, content):
+        if self.text is not None and not self.ignore:
+            self.text.append(content)
+
+
+def read_shared_strings(package: zipfile.ZipFile, part: str, indexes: set) -> dict:
+    '''Resolve shared string indexes to their text'''
+    reader = SharedStringsReader(indexes)
+    if part and indexes:
+        with package.open(part) as contents:
+            try:
+                sax_parse(contents, reader)
+            except StopScan:
+                pass
+    return reader.strings
+
+
+def cell_value(cell: tuple, strings: dict):
+    '''Python value of a raw (type, style, value) cell'''
+    kind, _, value = cell
+    if kind == 's':
+        return strings.get(int(value)) if value != '' else None
+    if kind in ('str', 'inlineStr', 'e'):
+        return value
+    if kind == 'b':
+        return value == '1'
+    if value == '':
+        return None
+    number = float(value)
+    return int(number) if number.is_integer() else number
+
+
+def excel_serial(value: datetime, date1904: bool) -> float:
+    '''Excel serial number of a date'''
+    epoch = datetime(1904, 1, 1) if date1904 else datetime(1899, 12, 30)
+    return (value.replace(tzinfo=None) - epoch).total_seconds() / 86400
+
+
+def value_kind(name: str, value) -> str:
+    '''Cell type a summary value is written with, None for numbers and empty cells'''
+    if isinstance(value, bool):
+        return 'b'
+    if isinstance(value, str):
+        return 'inlineStr'
+    if value is None or (isinstance(value, (int, float)) and math.isfinite(value)):
+        return None
+    raise ValueError(f"Cannot write '{name}' value {value!r} to a cell")
+
+
+def summary_cells(data_item: dict, header: dict, previous: dict, styles: dict,
+                  colinds: list, rowind: int, date1904: bool) -> list:
+    '''Cells of a new summary row as sorted (column, type, value) plus the style of the cell above'''
+    cells = []
+    for name, column in header.items():
+        if name == "Cumulative Number of executions":
+            value = int(previous.get(column) or 0)+1
+        elif name in data_item:
+            value = data_item[name] if data_item[name] != "" else "-"
+            if isinstance(value, datetime):
+                value = excel_serial(value, date1904)
+        else:
+            continue
+        cells.append((column, value_kind(name, value), value))
+    last = column_index_from_string(colinds[1])
+    cells.append((last, 'f', f"1-({data_item['Failed TCs (unstable)']}/{data_item['Total Number of TCs']})"))
+    cells.append((last+1, 'f', f"AVERAGE({colinds[1]}{rowind-10},{colinds[1]}{rowind})"))
+    # Formatting is inherited from the last row of the block, as by the openpyxl engine
+    return [(column, kind, value, styles.get(column))
+            for column, kind, value in sorted(cells, key=lambda cell: cell[0])]
+
+
+class SheetSplicer(PartReader):
+    '''
+    Copy a worksheet part merging the new cells into their rows. Rows without new cells are copied
+    byte for byte, only the updated rows are rebuilt
+    '''
+
+    def __init__(self, source, target, rows: dict):
+        super().__init__(source)
+        self.target = target
+        self.rows_cells = {rowind: sorted(cells, key=lambda cell: cell[0]) for rowind, cells in rows.items()}
+        self.queue = sorted(rows)
+        self.prefix = ''
+
+    def run(self):
+        sheet_data = self.search(SHEET_DATA_RE)
+        self.prefix = sheet_data.group(1).decode()
+        empty = bool(sheet_data.group(2))
+        self.target.write(DIMENSION_RE.sub(self.extend_dimension, self.consume(sheet_data.start()), count=1))
+        if empty:
+            self.consume(sheet_data.end())
+            self.target.write(f"<{self.prefix}sheetData>".encode())
         else:
-            total_stable_percent_cell(sheet, data[item], colindexes, rowindex)
-            average_stable_percent_cell(sheet, colindexes, rowindex)
+            self.target.write(self.consume(sheet_data.end()))
+            for gap, rowind, start_tag, content, element in self.rows(sheet_data.group(1)):
+                self.target.write(gap)
+                while self.queue and self.queue[0] < rowind:
+                    self.write_row(self.queue.pop(0), None, b'')
+                if self.queue and self.queue[0] == rowind:
+                    self.write_row(self.queue.pop(0), start_tag, content)
+                else:
+                    self.target.write(element)
+        while self.queue:
+            self.write_row(self.queue.pop(0), None, b'')
+        if empty:
+            self.target.write(f"</{self.prefix}sheetData>".encode())
+        self.target.write(self.consume(len(self.buffer)))
+        shutil.copyfileobj(self.source, self.target)
 
-    if not cancel:
-        print("[INFO] Saving changes to file")
-        workbook.save(params.filename)
+    def extend_dimension(self, match) -> bytes:
+        first, _, last = match.group(2).decode().partition(':')
+        last = last or first
+        column = last.rstrip('0123456789')
+        if self.queue and int(last[len(column):] or 0) < self.queue[-1]:
+            last = f"{column}{self.queue[-1]}"
+        return match.group(1) + f"{first}:{last}".encode() + match.group(3)
+
+    def write_row(self, rowind: int, start_tag: bytes, content: bytes):
+        '''Write a row merging its existing cells (content of the original row, if any) with the new ones'''
+        if start_tag is None:
+            start_tag = f'<{self.prefix}row r="{rowind}">'.encode()
+        else:
+            # Cell span hint of the row may no longer be right
+            start_tag = SPANS_ATTR_RE.sub(b'', start_tag)
+            if start_tag.endswith(b'/>'):
+                start_tag = start_tag[:-2].rstrip() + b'>'
+        pending = list(self.rows_cells[rowind])
+        parts = [start_tag]
+        position = 0
+        for cell in CELL_RE.finditer(content):
+            column = column_index_from_string(CELL_REF_RE.search(cell.group(0)).group(1).decode())
+            parts.append(content[position:cell.start()])
+            position = cell.end()
+            while pending and pending[0][0] < column:
+                parts.append(self.cell_xml(rowind, *pending.pop(0)))
+            if pending and pending[0][0] == column:
+                # Replaced by the new cell
+                parts.append(self.cell_xml(rowind, *pending.pop(0)))
+            else:
+                parts.append(cell.group(0))
+        parts.extend(self.cell_xml(rowind, *cell) for cell in pending)
+        parts.append(content[position:])
+        parts.append(f"</{self.prefix}row>".encode())
+        self.target.write(b''.join(parts))
+
+    def cell_xml(self, rowind: int, column: int, kind: str, value, style: str) -> bytes:
+        prefix = self.prefix
+        attrs = f' r="{get_column_letter(column)}{rowind}"'
+        if style is not None:
+            attrs += f' s="{style}"'
+        if kind == 'f':
+            body = f"<{prefix}f>{escape(value)}</{prefix}f>"
+        elif kind == 'b':
+            attrs += ' t="b"'
+            body = f"<{prefix}v>{int(value)}</{prefix}v>"
+        elif kind == 'inlineStr':
+            attrs += ' t="inlineStr"'
+            body = f"<{prefix}is><{prefix}t>{escape(value)}</{prefix}t></{prefix}is>"
+        elif value is None:
+            # Cleared as openpyxl does, keeping the style
+            body = ''
+        else:
+            body = f"<{prefix}v>{value}</{prefix}v>"
+        return f"<{prefix}c{attrs}>{body}</{prefix}c>".encode()
+
+
+def patch_sheet_part(source, target, rows: dict) -> None:
+    '''Stream a worksheet part from source to target adding the new rows cells'''
+    SheetSplicer(source, target, rows).run()
+
+
+############
+#   MAIN   #
+############
+if __name__ == '__main__':
+    result = 0
+    params = parse_arguments()
+    print("[INFO] Reading Jenkins build data")
+    records = read_inputs(params)
+    if params.history:
+        history = open_history(params.history)
+        print(f"[INFO] {store_history(history, records)} new record(s) stored in '{params.history}'")
+        if params.from_history:
+            records = history_records(history, params.since)
+        if params.trends:
+            import stabilityTrends
+            trends = stabilityTrends.analyse(history)
+            stabilityTrends.write_summary(trends, params.trends)
+            print(f"[INFO] Stability trends stored in '{params.trends}'")
+        history.close()
+    print(f"[INFO] {len(records)} summary record(s) to add")
+
+    print(f"[INFO] Opening workbook: '{params.filename}'")
+    if params.patch:
+        # A stale local file must never be patched and uploaded over the current attachment
+        if not download_file(params):
+            print("[ERROR] Cannot download workbook, nothing updated")
+            exit(1)
+        cancel = patch_workbook(params.filename, records, params.update_existing)
+    else:
+        workbook = download_workbook(params)
+        if workbook is None:
+            print("[ERROR] Cannot download workbook, nothing updated")
+            exit(1)
+        cancel = update_workbook(workbook, records, params.update_existing)
+        if not cancel:
+            if params.trends:
+                stabilityTrends.write_trends_sheet(workbook, trends)
+            print("[INFO] Saving changes to file")
+            workbook.save(params.filename)
 
-        if not params.dry_run:
-            print("[INFO] Upload file to Confluence")
-            result = upload_workbook(params)
+    if not cancel and not params.dry_run:
+        print("[INFO] Upload file to Confluence")
+        result = upload_workbook(params)
 
     exit(result)
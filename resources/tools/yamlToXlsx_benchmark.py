@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+#
+
+'''
+    Benchmark yamlToXlsx.py download -> update -> upload cycles over synthetic NFT_Automation_TCs.xlsx workbooks
+'''
+
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+import threading
+import contextlib
+import socketserver
+import http.server
+import urllib.parse
+from datetime import datetime, timedelta
+
+import openpyxl
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import yamlToXlsx  # noqa: E402
+from benchmark_common import run_case, timed, peak_rss_kb, save_report, compare  # noqa: E402
+
+
+ENGINES = ('openpyxl', 'patch')
+CASE_FIELDS = ('engine', 'rows', 'records')
+SHEET = 'CL2 UDM Stability'
+FILENAME = 'NFT_Automation_TCs.xlsx'
+PAGEID = '1'
+# (environment, clear, ipv6) of every START_COLUMN block
+BLOCKS = (
+    ('n-ans-1', False, False),
+    ('n-ans-1', True, False),
+    ('n-ibd-1', False, False),
+    ('n-ibd-1', True, False),
+    ('n-ibd-1', False, True),
+)
+HEADER = [
+    'Execution Date', 'Build number', 'Cumulative Number of executions', 'CCSM Drop', 'CCSM Version',
+    'Total Number of TCs', 'Number of executed TCs', 'Successful TCs', 'Cluster-related Failures',
+    'Failed TCs (unstable)', 'Failed TCs (CCSM)', 'Failed TCs (ADP)', 'Uninstallation TS Failures',
+    'Installation TS Failures', 'Traffic Mix TS Failures', 'Stability 1 hour TS Failures',
+    'Maintainability TS Failures', 'Robustness TS Failures', 'License TS Failures',
+    'Stability CL2 (stable/Total)', 'Stability CL2 Rolling average (last 10 executions)',
+]
+FIRST_DATE = datetime(2020, 1, 1)
+
+
+def main():
+    '''Main program'''
+    user_options = parse_commandline()
+
+    results = []
+    directory = tempfile.mkdtemp()
+    try:
+        for rows in user_options.rows:
+            workbook = os.path.join(directory, f'workbook_{rows}.xlsx')
+            start = time.monotonic()
+            generate_workbook(workbook, rows)
+            logging.info(f'Generated {rows} rows workbook in {time.monotonic() - start:.1f}s '
+                         f'({os.path.getsize(workbook) // 1024} KiB)')
+            for records in user_options.records:
+                for engine in user_options.engines:
+                    result = run_case(measure, engine, workbook, rows, records)
+                    phases = ', '.join(f'{phase} {seconds:.3f}s' for phase, seconds in result['phases'].items())
+                    logging.info(f'{engine:8} rows={rows} records={records}: {result["seconds"]:.3f}s ({phases}), '
+                                 f'peak RSS {result["peak_rss_kb"]} KiB')
+                    results.append(result)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    save_report(user_options.output, results, openpyxl=openpyxl.__version__)
+
+    if user_options.baseline:
+        return compare(user_options.baseline, results, user_options.threshold, CASE_FIELDS, cycles_per_second, 'cycles/s')
+    return 0
+
+
+def block_start(environment, clear, ipv6):
+    '''First column index of the START_COLUMN block of a record'''
+    data_item = {'environment': environment}
+    return openpyxl.utils.column_index_from_string(yamlToXlsx.get_columns_to_update(data_item, clear, ipv6)[0])
+
+
+def summary_record(environment, clear, ipv6, build):
+    '''Summary Yaml record as written by registerBuild, with the keys yamlToXlsx.py expects'''
+    unstable = build % 4
+    return (SHEET, {
+        'Execution Date': FIRST_DATE + timedelta(hours=build),
+        'Build number': str(build),
+        'environment': environment,
+        'CCSM Drop': f'{build // 50}-1',
+        'CCSM Version': f'eric-ccsm-1.{build // 50}.0',
+        'Total Number of TCs': 40,
+        'Number of executed TCs': '40',
+        'Successful TCs': str(40 - unstable),
+        'Cluster-related Failures': '',
+        'Failed TCs (unstable)': str(unstable),
+        'Failed TCs (CCSM)': str(unstable // 2),
+        'Failed TCs (ADP)': '',
+        'Uninstallation TS Failures': '0',
+        'Installation TS Failures': '0',
+        'Traffic Mix TS Failures': str(unstable),
+        'Stability 1 hour TS Failures': '',
+        'Maintainability TS Failures': '',
+        'Robustness TS Failures': '',
+        'License TS Failures': '',
+    }, clear, ipv6)
+
+
+def generate_workbook(path, rows):
+    '''Write a workbook with the real header layout and rows filled rows in every block'''
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet(SHEET)
+    starts = [block_start(*block) for block in BLOCKS]
+    width = max(starts) + len(HEADER) - 1
+    for _ in range(yamlToXlsx.HEADER_ROW - 1):
+        sheet.append([])
+    header = [None] * width
+    for start in starts:
+        header[start-1:start-1+len(HEADER)] = HEADER
+    sheet.append(header)
+    for build in range(rows):
+        row = [None] * width
+        rowind = yamlToXlsx.HEADER_ROW + 1 + build
+        for start, block in zip(starts, BLOCKS):
+            _, data_item, _, _ = summary_record(*block, build)
+            values = {name: value if value != '' else '-' for name, value in data_item.items()}
+            values['Cumulative Number of executions'] = build + 1
+            stability = openpyxl.utils.get_column_letter(start + len(HEADER) - 2)
+            values[HEADER[-2]] = f"=1-({data_item['Failed TCs (unstable)']}/{data_item['Total Number of TCs']})"
+            values[HEADER[-1]] = f'=AVERAGE({stability}{rowind-10},{stability}{rowind})'
+            row[start-1:start-1+len(HEADER)] = [values.get(name) for name in HEADER]
+        sheet.append(row)
+    workbook.save(path)
+
+
+class ConfluenceStandIn(http.server.BaseHTTPRequestHandler):
+    '''Attachment version, download and upload endpoints of Confluence used by yamlToXlsx.py'''
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, body=b'', content_type='application/json'):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        if url.path.endswith('/child/attachment'):
+            filename = urllib.parse.parse_qs(url.query).get('filename', [FILENAME])[0]
+            body = {'results': [{'title': filename, 'version': {'number': self.server.version}}]}
+            return self.reply(200, json.dumps(body).encode())
+        if url.path.startswith('/download/attachments/'):
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/octet-stream')
+            self.send_header('Content-Length', str(os.path.getsize(self.server.attachment)))
+            self.end_headers()
+            with open(self.server.attachment, 'rb') as contents:
+                shutil.copyfileobj(contents, self.wfile)
+            return None
+        return self.reply(404)
+
+    def do_POST(self):
+        remaining = int(self.headers.get('Content-Length', 0))
+        while remaining:
+            remaining -= len(self.rfile.read(min(remaining, 1 << 16)))
+        self.server.version += 1
+        self.reply(200, b'', 'text/html')
+
+
+class StandInServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    '''Threaded HTTP server holding the served attachment and its version'''
+
+    daemon_threads = True
+
+
+@contextlib.contextmanager
+def confluence_stand_in(attachment):
+    '''Serve attachment on a local port, yield its base URL'''
+    server = StandInServer(('127.0.0.1', 0), ConfluenceStandIn)
+    server.attachment = attachment
+    server.version = 1
+    thread = threading.Thread(target=server.serve_forever, args=(0.01,), daemon=True)
+    thread.start()
+    try:
+        yield f'http://127.0.0.1:{server.server_address[1]}'
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def measure(engine, workbook, rows, records):
+    '''Run one download -> update -> upload cycle of records new builds per block against a stand-in Confluence'''
+    phases = {}
+    # Row location is timed inside the update engines
+    yamlToXlsx.get_sheet_layout = timed(phases, 'locate', yamlToXlsx.get_sheet_layout)
+    yamlToXlsx.scan_blocks = timed(phases, 'locate', yamlToXlsx.scan_blocks)
+    batch = [summary_record(*block, build) for build in range(rows, rows + records) for block in BLOCKS]
+    directory = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    try:
+        os.chdir(directory)
+        with confluence_stand_in(workbook) as url, open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            params = argparse.Namespace(url=url, pageid=PAGEID, filename=FILENAME, userid='benchmark', password='',
+                                        cache_dir=directory, no_cache=True, timeout=60.0, retries=0)
+            start = time.monotonic()
+            timed(phases, 'download', yamlToXlsx.download_file)(params)
+            if engine == 'patch':
+                cancel = timed(phases, 'update', yamlToXlsx.patch_workbook)(FILENAME, batch)
+            else:
+                book = timed(phases, 'load', openpyxl.load_workbook)(FILENAME)
+                cancel = timed(phases, 'update', yamlToXlsx.update_workbook)(book, batch)
+                timed(phases, 'save', book.save)(FILENAME)
+            result = timed(phases, 'upload', yamlToXlsx.upload_workbook)(params)
+            seconds = time.monotonic() - start
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(directory, ignore_errors=True)
+    # Update engines include row location
+    phases['update'] -= phases.get('locate', 0.0)
+    return {
+        'engine': engine,
+        'rows': rows,
+        'records': records,
+        'cells': rows * len(BLOCKS) * len(HEADER),
+        'failed': bool(cancel or result),
+        'seconds': seconds,
+        'phases': phases,
+        'peak_rss_kb': peak_rss_kb(),
+    }
+
+
+def cycles_per_second(result):
+    '''Throughput of a benchmark case'''
+    return 1.0 / result['seconds'] if result['seconds'] else 0.0
+
+
+def parse_commandline():
+    '''Parse and check command line'''
+    parser = argparse.ArgumentParser(prog=os.path.basename(__file__), description=__doc__)
+
+    parser.add_argument('-e', '--engines', nargs='+', choices=ENGINES, default=list(ENGINES), help='Update engines to benchmark', dest='engines')
+    parser.add_argument('-r', '--rows', nargs='+', type=int, default=[1000, 10000, 50000], help='Filled rows of every block', dest='rows')
+    parser.add_argument('-k', '--records', nargs='+', type=int, default=[1, 100], help='New builds added to every block per cycle', dest='records')
+    parser.add_argument('-o', '--output', default='yamlToXlsx_benchmark.json', help='JSON results file', dest='output')
+    parser.add_argument('-b', '--baseline', default=None, help='JSON results of a previous run to compare with', dest='baseline')
+    parser.add_argument('-t', '--threshold', type=float, default=20.0, help='Allowed throughput loss against baseline, in percent', dest='threshold')
+    parser.add_argument('-d', '--debug', action='store_true', default=False, help='Show debug logging', dest='debug')
+
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO)
+
+    return args
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,6 +1,8 @@
 /**
  * parameters:
  *    timeout
+ *    fast_verify: only match the feature steps against the step definitions, through the
+ *                 node verifier daemon, instead of running behave (default: false)
  */
 
 def call(body) {
@@ -37,9 +39,8 @@ def call(body) {
         if (lfiles.size() > 0) {
             stage("Verify changes") {
                 def verify_script = common.copyGlobalLibraryScript('tools/feature_verifier.py')
-                lfiles.each { cfile->
-                    sh "${verify_script} ${cfile}"
-                }
+                def verify_options = (config.fast_verify ?: false).toString().toBoolean() ? '--connect --start-daemon ' : ''
+                sh "${verify_script} ${verify_options}${lfiles.join(' ')}"
             }
         }
 